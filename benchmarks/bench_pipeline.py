@@ -0,0 +1,203 @@
+"""
+Scaling benchmark of the config generator pipeline.
+
+Runs every stage of the pipeline on a grid of synthetic configurations and
+records wall time and peak traced memory per stage in a JSON report. Each
+configuration is run once untraced for timings and, unless --no-memory is
+given, once more under tracemalloc for memory (tracing slows numpy down).
+
+    python -m benchmarks.bench_pipeline --files 1000 10000 --splits 1 4 -r report.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from src.generator import (
+    generate_files,
+    parse_config,
+    split_groups,
+    select_module_files,
+    generate_file_matrix,
+    generate_module_matrix,
+    generate_issue_matrix,
+    write_repo_markov,
+)
+from src.issues import IssueChunks
+from src.rng import RandomStreams
+
+GRID = {
+    "files": [1_000, 10_000, 100_000, 1_000_000],
+    "lenght": [5, 20],
+    "ungrouped": [500],
+    "modules": [200],
+    "issues": [500],
+    "splits": [1, 8],
+}
+SEED = 42
+
+
+def make_config(files:int, lenght:int, ungrouped:int, modules:int, issues:int) -> dict:
+    """
+    returns a generator configuration where about `ungrouped` files are left out of
+    the file groups. The ungrouped block is dense, so it is kept small.
+    """
+    groups = max(1, (files - min(ungrouped, files - 1)) // lenght)
+    return {
+        "Files": {
+            "prefix": "File",
+            "number": files,
+            "filegroups": {"number": groups, "lenght": lenght, "random": True, "p": 0.95},
+        },
+        "Modules": {"prefix": "Module", "number": modules, "lambda": 50, "random": True},
+        "Authors": {"prefix": "Author", "number": 10, "contribution": "random"},
+        "Issues": {"prefix": "issue", "number": issues, "n_modules": 2, "lambda": 5, "random": True},
+    }
+
+
+class StageRecorder:
+    """
+    Accumulates wall time and peak memory of the pipeline stages.
+    """
+    def __init__(self, trace_memory:bool):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name:str):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        record = self.stages.setdefault(name, {"calls": 0, "seconds": 0.})
+        record["calls"] += 1
+        record["seconds"] += elapsed
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            record["peak_bytes"] = max(record.get("peak_bytes", 0), peak)
+            record["peak_increase_bytes"] = max(record.get("peak_increase_bytes", 0), peak - current)
+
+
+def run_pipeline(path_to_config:Path, n_split:int, out_dir:Path, recorder:StageRecorder) -> dict:
+    """
+    runs the pipeline stage by stage, the same way generate_markov does with one
+    worker and no artifacts, and returns the sizes of what was generated. Issues
+    are materialized once per repo so that their generation is timed on its own.
+    """
+    streams = RandomStreams(SEED)
+    with open(path_to_config) as f:
+        raw_config = yaml.safe_load(f)
+
+    with recorder.stage("generate_files"):
+        generate_files(streams.generator("files"), raw_config["Files"]["number"], raw_config["Files"]["filegroups"])
+    with recorder.stage("parse_config"):
+        config, ids, modules, authors = parse_config(path_to_config, streams)
+    with recorder.stage("split_groups"):
+        ids = split_groups(streams.generator("split"), ids, n_split)
+    with recorder.stage("select_module_files"):
+        all_files = np.concatenate([ids.repo_files(r) for r in range(len(ids.repos))])
+        all_modules = select_module_files(streams.generator("module_files"), modules, all_files)
+    with recorder.stage("select_issue_modules"):
+        all_issues = IssueChunks(streams, len(ids.issues), len(ids.modules), config["Issues"]["n_modules"])
+        for _ in all_issues:
+            pass
+
+    counts = {"files": len(ids.files), "groups": len(ids.groups), "repos": len(ids.repos),
+              "file_edges": 0, "module_edges": 0, "issue_edges": 0, "output_bytes": 0}
+    for i in range(len(ids.repos)):
+        with recorder.stage("generate_file_matrix"):
+            filematrix, fileauthors, _ = generate_file_matrix(streams, ids, i, authors)
+        with recorder.stage("generate_module_matrix"):
+            modulematrix, repo_modules = generate_module_matrix(streams.generator("modulematrix", i), ids, all_modules, i)
+        with recorder.stage("generate_issue_matrix"):
+            issuematrix = generate_issue_matrix(streams, ids, all_issues, i, repo_modules).to_matrix()
+        with recorder.stage("generate_markov"):
+            write_repo_markov(
+                streams, ids, i, config,
+                filematrix, fileauthors, modulematrix, issuematrix, out_dir
+            )
+        counts["file_edges"] += filematrix.nnz
+        counts["module_edges"] += modulematrix.nnz
+        counts["issue_edges"] += issuematrix.nnz
+        counts["output_bytes"] += (out_dir / f"markov_{ids.repos.name(i)}.yaml").stat().st_size
+        del filematrix, fileauthors, modulematrix, issuematrix
+
+    return counts
+
+
+def run_case(params:dict, trace_memory:bool) -> dict:
+    config = make_config(params["files"], params["lenght"], params["ungrouped"], params["modules"], params["issues"])
+    result = {"params": params}
+    with tempfile.TemporaryDirectory() as tmp:
+        path_to_config = Path(tmp) / "config.yaml"
+        with open(path_to_config, "w") as f:
+            yaml.safe_dump(config, f)
+        try:
+            recorder = StageRecorder(trace_memory=False)
+            result["counts"] = run_pipeline(path_to_config, params["splits"], Path(tmp), recorder)
+            stages = recorder.stages
+            if trace_memory:
+                recorder = StageRecorder(trace_memory=True)
+                tracemalloc.start()
+                try:
+                    run_pipeline(path_to_config, params["splits"], Path(tmp), recorder)
+                finally:
+                    tracemalloc.stop()
+                for name, record in recorder.stages.items():
+                    stages[name]["peak_bytes"] = record["peak_bytes"]
+                    stages[name]["peak_increase_bytes"] = record["peak_increase_bytes"]
+            result["stages"] = stages
+            result["seconds"] = sum(record["seconds"] for record in stages.values())
+            result["status"] = "ok"
+        except Exception as e:
+            logging.exception(f"benchmark case {params} failed")
+            result["status"] = f"error: {e!r}"
+    return result
+
+
+def main(args):
+    grid = {key: getattr(args, key) for key in GRID}
+    cases = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": SEED,
+        "grid": grid,
+        "results": [],
+    }
+    for params in cases:
+        logging.info(f"running {params}")
+        result = run_case(params, trace_memory=not args.no_memory)
+        report["results"].append(result)
+        logging.info(f"{result['status']} in {result.get('seconds', 0.):.2f}s")
+        # the report is rewritten after every case, so a killed run keeps its results
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the config generator pipeline.")
+    parser.add_argument("--files", type=int, nargs="+", default=GRID["files"], help="number of files")
+    parser.add_argument("--lenght", type=int, nargs="+", default=GRID["lenght"], help="average file group size")
+    parser.add_argument("--ungrouped", type=int, nargs="+", default=GRID["ungrouped"], help="approximate number of ungrouped files")
+    parser.add_argument("--modules", type=int, nargs="+", default=GRID["modules"], help="number of modules")
+    parser.add_argument("--issues", type=int, nargs="+", default=GRID["issues"], help="number of issues")
+    parser.add_argument("--splits", type=int, nargs="+", default=GRID["splits"], help="number of repos")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("-r", "--report", type=str, default="bench_report.json", help="path to the JSON report. Default bench_report.json")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    main(parser.parse_args())
@@ -0,0 +1,38 @@
+import copy
+import logging
+import argparse
+import yaml
+from src.evolution import Snapshot, evolve_series
+
+PATH_TO_CONFIG = "./configs/config.yaml"
+PATH_TO_OUTPUT = "./evolution"
+
+def main(args):
+
+    if args.snapshot is not None:
+        snapshot = Snapshot.load(args.snapshot)
+        logging.info(f"Snapshot of step {snapshot.step} loaded from {args.snapshot}")
+    else:
+        snapshot = Snapshot.generate(args.input, args.split, seed=args.seed, workers=args.workers)
+    deltas = []
+    for path in args.deltas:
+        with open(path, "r") as f:
+            content = yaml.safe_load(f)
+        # a file holds one delta or a list of them, one per step
+        deltas += content if isinstance(content, list) else [content]
+    # copies, so that the saved snapshots hold plain deltas instead of yaml aliases
+    evolve_series(snapshot, [copy.deepcopy(d) for _ in range(args.repeat) for d in deltas], args.output)
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Evolution series of repo-generator configs, every step applying a delta to the previous one.")
+    parser.add_argument("-i", "--input", type=str, help=f"path to input configuration yaml file. Default {PATH_TO_CONFIG}", default=PATH_TO_CONFIG)
+    parser.add_argument("--from", dest="snapshot", type=str, help="directory of a saved step to evolve instead of generating from the config", default=None)
+    parser.add_argument("-d", "--deltas", type=str, nargs="*", help="yaml files holding the deltas of the steps, applied in order", default=[])
+    parser.add_argument("-r", "--repeat", type=int, help="number of times the deltas are applied. Default 1", default=1)
+    parser.add_argument("-o", "--output", type=str, help=f"output directory, one step_<n> directory per step. Default {PATH_TO_OUTPUT}", default=PATH_TO_OUTPUT)
+    parser.add_argument("-s", "--split", type=int, help="number of repos. Default 1", default=1)
+    parser.add_argument("--seed", type=int, help="seed", default=None)
+    parser.add_argument("-w", "--workers", type=int, help="number of worker processes generating repos in parallel. Default 1", default=1)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    main(parser.parse_args())
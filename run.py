@@ -1,9 +1,15 @@
+import json
 import logging
 import argparse
 import os
 from pathlib import Path
 import yaml
 from src.generator import *
+from src.artifacts import ArtifactStore, ARTIFACT_FORMATS
+from src.metrics import Metrics
+from src.cache import StageCache
+from src.validation import Validator, VALIDATION_LEVELS
+from src.estimate import estimate_run, memory_budget_for
 
 TMP_DIR = "tmp"
 PATH_TO_CONFIG = "./configs/config.yaml"
@@ -12,20 +18,63 @@ SEED = 42
 
 def main(args):
 
-    if not os.path.isdir(Path(TMP_DIR)):
-        os.mkdir(Path(TMP_DIR))
-    
+    memory_budget = None if args.memory_budget is None else int(args.memory_budget * 2**20)
+    if args.dry_run or args.max_memory is not None:
+        estimate = estimate_run(args.input, args.split, args.workers, args.tmp_format, memory_budget)
+        fits = True
+        if args.max_memory is not None and memory_budget is None:
+            try:
+                memory_budget = memory_budget_for(estimate, int(args.max_memory * 2**20))
+            except ValueError as e:
+                if not args.dry_run:
+                    raise SystemExit(f"{e} Raise --max-memory, use fewer workers or fewer ungrouped files.")
+                logging.error(str(e))
+                fits = False
+            if memory_budget is not None:
+                logging.info(
+                    f"Predicted peak memory {estimate['memory_bytes']['total'] >> 20}MB exceeds {args.max_memory}MB, "
+                    f"file matrices are generated with a memory budget of {memory_budget >> 20}MB per worker."
+                )
+                estimate = estimate_run(args.input, args.split, args.workers, args.tmp_format, memory_budget)
+        if args.dry_run:
+            if args.max_memory is not None:
+                estimate["max_memory"] = int(args.max_memory * 2**20)
+                estimate["fits"] = fits
+            print(json.dumps(estimate, indent=2))
+            if not fits:
+                raise SystemExit(1)
+            return
+
     path_to_output = Path(args.output)
     out_dir = path_to_output.parent
     if not os.path.isdir(out_dir):
         os.mkdirs(out_dir)
 
-    generate_markov(
-        Path(args.input), 
-        args.split, 
-        path_to_output, 
-        seed=args.seed
-    )
+    metrics = Metrics()
+    validator = Validator(args.validate)
+    try:
+        with metrics.stage("total"):
+            generate_markov(
+                Path(args.input), 
+                args.split, 
+                path_to_output, 
+                seed=args.seed,
+                workers=args.workers,
+                artifacts=ArtifactStore(args.tmp_dir, args.tmp_format),
+                metrics=metrics,
+                cache=StageCache(args.cache_dir),
+                memory_budget=memory_budget,
+                validator=validator,
+                write_queue=args.write_queue
+            )
+    finally:
+        # the validation report is most useful when the run failed
+        if args.validation_report:
+            validator.save(args.validation_report)
+            logging.info(f"Validation report saved {args.validation_report}")
+    if args.metrics:
+        metrics.save(args.metrics)
+        logging.info(f"Metrics saved {args.metrics}")
 
 if __name__=="__main__":
     parser = argparse.ArgumentParser(description="Impact synthetic repo-generator config generator.")
@@ -33,5 +82,17 @@ if __name__=="__main__":
     parser.add_argument("-o", "--output", type=str, help=f"path to output generator config file. Default {PATH_TO_MARKOV}", default=PATH_TO_MARKOV)
     parser.add_argument("-s", "--split", type=int, help="number of splits determines the how many related repo-generator configs are returned in output. Defalult 1", default=1)
     parser.add_argument("--seed", type=int, help="seed", default=None)
+    parser.add_argument("--tmp-dir", type=str, help=f"directory of the intermediate matrices. Default {TMP_DIR}", default=TMP_DIR)
+    parser.add_argument("--tmp-format", type=str, choices=ARTIFACT_FORMATS, help="format of the intermediate matrices: csv, npz archives, npy directories (memory-mappable) or none to skip them. Default csv", default="csv")
+    parser.add_argument("-w", "--workers", type=int, help="number of worker processes generating repos in parallel. Default 1", default=1)
+    parser.add_argument("--metrics", "--profile", type=str, help="path to a JSON report of the stage timings, peak memory, counts and output sizes of the run", default=None)
+    parser.add_argument("--cache-dir", type=str, help="directory of the stage cache. Seeded runs reuse the outputs of the stages whose config sections and inputs did not change. Disabled by default", default=None)
+    parser.add_argument("--memory-budget", type=float, help="memory budget in MB of the file matrix of a repo, per worker. The file matrix, fileauthors and file nodes are then generated and written group by group instead of being built whole. Disabled by default", default=None)
+    parser.add_argument("--max-memory", type=float, help="memory limit in MB of the whole run. If the predicted peak memory exceeds it, the file matrices are generated with the memory budget that fits, see --memory-budget. Disabled by default", default=None)
+    parser.add_argument("--dry-run", action="store_true", help="prints the predicted sizes, peak memory and stage timings of the run, and the memory budget picked for --max-memory, without generating anything")
+    parser.add_argument("--write-queue", type=int, help=f"number of 1MB blocks of output waiting to be written on the background writer thread, 0 to write them in line. Default {WRITE_QUEUE}", default=WRITE_QUEUE)
+    parser.add_argument("--validate", type=str, choices=VALIDATION_LEVELS, help="checks of the probability invariants of the transitions: every row (full), a random sample of rows of every matrix (sampled) or none (off). Default full", default="full")
+    parser.add_argument("--validation-report", type=str, help="path to a JSON report of the rows checked and of the violations found", default=None)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     
     main(parser.parse_args())
\ No newline at end of file
@@ -0,0 +1,379 @@
+import logging
+import numpy as np
+from typing import Annotated, Optional, Tuple
+
+from src.tags import tag, Initial, Issue, Module, File, Author, Commit
+from src.transitions import NodeBlock, TransitionStore
+from src.model import MarkovModel
+
+# node kinds of a markov chain, in the order of their node numbers
+NODE_KINDS = (Initial, Issue, Module, File, Author, Commit)
+# walks of the monte carlo simulator still running after MAX_STEPS are dropped
+MAX_STEPS = 100_000
+# rows of every ranking of a statistics report
+TOP_NODES = 20
+
+
+def ranks(n:int, values:np.ndarray) -> Tuple[
+    Annotated[np.ndarray, "unique"],
+    Annotated[np.ndarray, "rank"]
+]:
+    """
+    returns the distinct values among range(n) and the rank of every value in
+    range(n) among them, without sorting.
+    """
+    present = np.zeros(n, dtype=bool)
+    present[values] = True
+    return np.flatnonzero(present), np.cumsum(present) - 1
+
+
+def loop_components(n:int, sources:np.ndarray, targets:np.ndarray) -> np.ndarray:
+    """
+    returns the connected component of every node of a graph of n nodes, as the
+    smallest node of the component, by label propagation with pointer jumping.
+    """
+    labels = np.arange(n)
+    while True:
+        new = labels.copy()
+        np.minimum.at(new, sources, labels[targets])
+        np.minimum.at(new, targets, labels[sources])
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+class LoopSolver:
+    """
+    Inverse of I - L, L being the transitions between nodes of the same kind (file
+    to file): L is block diagonal, one block for every group of files, so every
+    block is inverted densely and the blocks of the same size at once. Nodes out of
+    the blocks are left unchanged.
+    """
+    __slots__ = ("groups",)
+
+    def __init__(self, n:int, sources:np.ndarray, targets:np.ndarray, p:np.ndarray):
+        self.groups = []
+        if not len(sources):
+            return
+        nodes, rank = ranks(n, np.concatenate([sources, targets]))
+        a, b = rank[sources], rank[targets]
+        labels = loop_components(len(nodes), a, b)
+        _, component = ranks(len(nodes), labels)
+        component = component[labels]
+        sizes = np.bincount(component)
+        order = np.argsort(component, kind="stable")
+        # position of every node in its block
+        starts = np.cumsum(sizes) - sizes
+        local = np.empty(len(nodes), dtype=np.int64)
+        local[order] = np.arange(len(nodes)) - np.repeat(starts, sizes)
+        for size in np.unique(sizes).tolist():
+            components = np.flatnonzero(sizes == size)
+            batch = np.full(len(sizes), -1)
+            batch[components] = np.arange(len(components))
+            members = np.empty((len(components), size), dtype=np.int64)
+            in_batch = batch[component] >= 0
+            members[batch[component[in_batch]], local[in_batch]] = nodes[in_batch]
+            blocks = np.zeros((len(components), size, size))
+            entries = in_batch[a]
+            np.add.at(blocks, (batch[component[a[entries]]], local[a[entries]], local[b[entries]]), -p[entries])
+            blocks[:, np.arange(size), np.arange(size)] += 1.
+            self.groups.append((members, np.linalg.inv(blocks)))
+
+    def forward(self, x:np.ndarray) -> np.ndarray:
+        """
+        returns x (I - L)^-1.
+        """
+        y = x.copy()
+        for members, inverse in self.groups:
+            y[members] = np.einsum("mi,mij->mj", x[members], inverse)
+        return y
+
+    def backward(self, x:np.ndarray) -> np.ndarray:
+        """
+        returns (I - L)^-1 x.
+        """
+        y = x.copy()
+        for members, inverse in self.groups:
+            y[members] = np.einsum("mij,mj->mi", inverse, x[members])
+        return y
+
+
+class MarkovChain:
+    """
+    Transitions of every node of a markov model as a single CSR matrix over node
+    numbers: the nodes of the TransitionStores of the model are numbered kind by
+    kind, in the order of NODE_KINDS, each node once. Walks (commits) start at
+    Initial and end at Commit, the only node without transitions.
+    """
+    __slots__ = ("blocks", "offsets", "indptr", "rows", "targets", "p", "loop", "loops")
+
+    def __init__(self, blocks:list, indptr:np.ndarray, targets:np.ndarray, p:np.ndarray):
+        self.blocks = blocks
+        self.offsets = np.cumsum([0] + [len(block) for block in blocks])
+        assert len(indptr) == self.offsets[-1] + 1, "indptr must have one entry more than the nodes."
+        assert len(targets) == len(p) == indptr[-1], "targets and p must match indptr."
+        self.indptr = indptr
+        self.rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        self.targets = targets
+        self.p = p
+        kinds = np.repeat(np.arange(len(blocks)), [len(block) for block in blocks])
+        # transitions between nodes of the same kind
+        self.loop = kinds[self.rows] == kinds[targets]
+        self.loops = LoopSolver(self.n_nodes, self.rows[self.loop], targets[self.loop], p[self.loop])
+
+    @classmethod
+    def from_transitions(cls, stores:list[TransitionStore]) -> "MarkovChain":
+        """
+        merges the stores of a model, e.g. MarkovModel.transitions. Every node must
+        have its transitions in one store at most.
+        """
+        names, ids = {}, {}
+        for store in stores:
+            for block in store.blocks:
+                names.setdefault(block.cls, block.names)
+                ids.setdefault(block.cls, []).append(block.ids)
+        kinds = [kind for kind in NODE_KINDS if kind in ids]
+        assert len(kinds) == len(ids), f"node kinds must be among {NODE_KINDS}"
+        ids = {kind: np.concatenate(ids[kind]) for kind in kinds}
+        unique = {kind: ranks(int(ids[kind].max()) + 1, ids[kind]) for kind in kinds}
+        blocks = [NodeBlock(kind, names[kind], unique[kind][0]) for kind in kinds]
+        offsets = dict(zip(kinds, np.cumsum([0] + [len(block) for block in blocks]).tolist()))
+        n_nodes = sum(len(block) for block in blocks)
+
+        sources, counts, targets, p = [], [], [], []
+        for store in stores:
+            # chain node number of every node of the store
+            node = np.concatenate([offsets[block.cls] + unique[block.cls][1][block.ids] for block in store.blocks])
+            sources.append(node[store.sources])
+            counts.append(np.diff(store.indptr))
+            targets.append(node[store.targets])
+            p.append(store.p)
+        sources = np.concatenate(sources)
+        assert np.bincount(sources, minlength=1).max() <= 1, "every node must have its transitions in one store."
+        counts = np.concatenate(counts)
+        order = np.argsort(np.repeat(sources, counts), kind="stable")
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, weights=counts, minlength=n_nodes).astype(np.int64), out=indptr[1:])
+        return cls(blocks, indptr, np.concatenate(targets)[order], np.concatenate(p)[order])
+
+    @classmethod
+    def from_model(cls, model:MarkovModel) -> "MarkovChain":
+        return cls.from_transitions(model.transitions)
+
+    @property
+    def n_nodes(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def nnz(self) -> int:
+        return len(self.p)
+
+    def nodes(self, kind:type[tag]) -> slice:
+        """
+        returns the node numbers of kind, empty if the chain has no such node.
+        """
+        for k, block in enumerate(self.blocks):
+            if block.cls is kind:
+                return slice(int(self.offsets[k]), int(self.offsets[k + 1]))
+        return slice(0, 0)
+
+    def block(self, kind:type[tag]) -> Optional[NodeBlock]:
+        return next((block for block in self.blocks if block.cls is kind), None)
+
+    def labels(self) -> list[str]:
+        return [label for block in self.blocks for label in block.labels()]
+
+    def forward(self, x:np.ndarray, loops:bool=True) -> np.ndarray:
+        """
+        returns x P, P being the transition matrix, or x (P - L) without the
+        transitions between nodes of the same kind.
+        """
+        weights = x[self.rows] * self.p
+        if not loops:
+            weights[self.loop] = 0.
+        return np.bincount(self.targets, weights=weights, minlength=self.n_nodes)
+
+    def backward(self, x:np.ndarray, loops:bool=True) -> np.ndarray:
+        """
+        returns P x, or (P - L) x without the transitions between nodes of the same
+        kind.
+        """
+        weights = self.p * x[self.targets]
+        if not loops:
+            weights[self.loop] = 0.
+        return np.bincount(self.rows, weights=weights, minlength=self.n_nodes)
+
+    def start(self) -> np.ndarray:
+        """
+        returns the distribution of the first node of a walk, Initial.
+        """
+        x = np.zeros(self.n_nodes)
+        x[self.nodes(Initial)] = 1.
+        return x
+
+
+def solve_layers(chain:MarkovChain, x:np.ndarray, step, solve) -> np.ndarray:
+    """
+    solves y = x + y P (or y = x + P y) by splitting P in the transitions between
+    nodes of the same kind, solved exactly by chain.loops, and the others. The
+    others go from a kind to a later one, so y is found in one pass per kind.
+    """
+    y = solve(x)
+    for _ in range(len(chain.blocks)):
+        new = solve(x + step(y, loops=False))
+        if np.array_equal(new, y):
+            return new
+        y = new
+    logging.warning("Transitions between node kinds are not ordered, expected values may be wrong.")
+    return y
+
+
+def expected_visits(chain:MarkovChain, start:Optional[np.ndarray]=None) -> np.ndarray:
+    """
+    returns the expected number of visits of every node in a walk from start
+    (Initial by default) to Commit: the solution of v = start + v P.
+    """
+    start = chain.start() if start is None else start
+    return solve_layers(chain, start, chain.forward, chain.loops.forward)
+
+
+def expected_rewards(chain:MarkovChain, reward:np.ndarray) -> np.ndarray:
+    """
+    returns the expected total reward collected by a walk from every node to
+    Commit, the node it starts from included: the solution of h = reward + P h.
+    """
+    return solve_layers(chain, reward, chain.backward, chain.loops.backward)
+
+
+def walk_lengths(chain:MarkovChain) -> np.ndarray:
+    """
+    returns the expected number of transitions from every node to Commit.
+    """
+    return expected_rewards(chain, (np.diff(chain.indptr) > 0).astype(float))
+
+
+def stationary_distribution(chain:MarkovChain, visits:Optional[np.ndarray]=None) -> np.ndarray:
+    """
+    returns the stationary distribution of the chain restarted at Initial after
+    every Commit. A walk is a renewal cycle of that chain, so the distribution is
+    the expected visits of a walk over the expected number of nodes it visits.
+    """
+    visits = expected_visits(chain) if visits is None else visits
+    return visits / visits.sum()
+
+
+def simulate_walks(
+    chain:MarkovChain,
+    n_walks:int,
+    seed:Optional[int]=None,
+    max_steps:int=MAX_STEPS
+) -> Tuple[
+    Annotated[np.ndarray, "visits"],
+    Annotated[np.ndarray, "lengths"]
+]:
+    """
+    Simulates n_walks walks from Initial to Commit, all the walks taking a step at
+    once, and returns the number of visits of every node and the number of
+    transitions of every walk. Walks still running after max_steps are dropped
+    from the visits and have length -1.
+    """
+    rng = np.random.default_rng(seed)
+    # the transition of a step is found by bisection in the cumulated probabilities
+    cumulated = np.cumsum(chain.p)
+    node = np.full(n_walks, chain.nodes(Initial).start, dtype=np.int64)
+    lengths = np.zeros(n_walks, dtype=np.int64)
+    # node is updated in place, the path keeps copies of it
+    path = [node.copy()]
+    walkers = [np.arange(n_walks)]
+    active = np.arange(n_walks)
+    for _ in range(max_steps):
+        a, b = chain.indptr[node[active]], chain.indptr[node[active] + 1]
+        running = b > a
+        active, a, b = active[running], a[running], b[running]
+        if not len(active):
+            break
+        base = np.where(a > 0, cumulated[a - 1], 0.)
+        u = base + rng.random(len(active)) * (cumulated[b - 1] - base)
+        node[active] = chain.targets[np.clip(np.searchsorted(cumulated, u, side="right"), a, b - 1)]
+        lengths[active] += 1
+        path.append(node[active])
+        walkers.append(active)
+    else:
+        logging.warning(f"{len(active)} walks were still running after {max_steps} steps.")
+        lengths[active] = -1
+    path, walkers = np.concatenate(path), np.concatenate(walkers)
+    finished = lengths[walkers] >= 0
+    visits = np.bincount(path[finished], minlength=chain.n_nodes)
+    assert visits[chain.nodes(Initial).start] == (lengths >= 0).sum(), "every finished walk starts from Initial once."
+    return visits, lengths
+
+
+def top_nodes(names:list, values:np.ndarray, top:int) -> dict:
+    order = np.argsort(-values, kind="stable")[:top]
+    return {names[k]: float(values[k]) for k in order.tolist()}
+
+
+def summary(values:np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    return {"mean": float(values.mean()), "min": float(values.min()), "max": float(values.max())}
+
+
+def markov_statistics(
+    model:MarkovModel,
+    top:int=TOP_NODES,
+    walks:int=0,
+    seed:Optional[int]=None
+) -> dict:
+    """
+    Computes the expected statistics of the commits of a model, a commit being a
+    walk from Initial to Commit: visits of every file, share of every author (every
+    walk reaches one author), transitions and file visits of the walks from every
+    issue and the stationary distribution of the chain restarted after every
+    Commit, summed by node kind. Nodes are reported by name, only the top files
+    by visits and issues by file visits. With walks > 0 the statistics are also estimated by monte
+    carlo simulation, with the largest differences from the expected values.
+    """
+    chain = MarkovChain.from_model(model)
+    labels = chain.labels()
+    visits = expected_visits(chain)
+    lengths = walk_lengths(chain)
+    files, authors, issues = chain.nodes(File), chain.nodes(Author), chain.nodes(Issue)
+    file_reward = np.zeros(chain.n_nodes)
+    file_reward[files] = 1.
+    issue_files = expected_rewards(chain, file_reward)[issues]
+    stationary = stationary_distribution(chain, visits)
+
+    statistics = {
+        "repo": model.repo_id,
+        "nodes": chain.n_nodes,
+        "edges": chain.nnz,
+        "walk_length": float(lengths[chain.nodes(Initial)].sum()),
+        "files_per_commit": float(visits[files].sum()),
+        "authors": dict(zip(labels[authors], visits[authors].tolist())),
+        "files": {
+            "visited": int((visits[files] > 0).sum()),
+            "visits": summary(visits[files]),
+            "top": top_nodes(labels[files], visits[files], top),
+        },
+        "issues": {
+            "walk_length": summary(lengths[issues]),
+            "files_per_commit": summary(issue_files),
+            "top": top_nodes(labels[issues], issue_files, top),
+        },
+        "stationary": {block.cls.yaml_tag: float(stationary[chain.nodes(block.cls)].sum()) for block in chain.blocks},
+    }
+    if walks > 0:
+        counts, walk_length = simulate_walks(chain, walks, seed)
+        finished = walk_length >= 0
+        simulated = counts / max(finished.sum(), 1)
+        statistics["simulation"] = {
+            "walks": walks,
+            "finished": int(finished.sum()),
+            "walk_length": float(walk_length[finished].mean()) if finished.any() else None,
+            "files_per_commit": float(simulated[files].sum()),
+            "author_share_error": float(np.abs(simulated[authors] - visits[authors]).max(initial=0.)),
+            "file_visits_error": float(np.abs(simulated[files] - visits[files]).max(initial=0.)),
+        }
+    return statistics
@@ -0,0 +1,284 @@
+import os
+import shutil
+from pathlib import Path
+from typing import IO, Annotated, Iterable, Optional, Tuple
+import numpy as np
+
+from src.ids import NameIndex
+from src.sparse import SparseMatrix, FileAuthors
+from src.writer import BackgroundWriter, WRITE_BUFFER
+
+ARTIFACT_FORMATS = ("csv", "npz", "npy", "none")
+EXTENSIONS = {"csv": ".csv", "npz": ".npz", "npy": ""}
+# rows of a table formatted at a time when it is written as csv
+CSV_ROWS = 1 << 16
+
+
+def concat_csv(paths:list, path_to_csv:str):
+    """
+    Concatenates csv files sharing the same header into a single file.
+    """
+    with open(path_to_csv, "w") as out:
+        for i, path in enumerate(paths):
+            with open(path, "r") as f:
+                header = f.readline()
+                if not i:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+
+
+def write_frame(f:IO[str], frame:"pd.DataFrame", header:bool, index:bool):
+    """
+    writes a DataFrame as csv, CSV_ROWS rows at a time.
+    """
+    for a in range(0, max(len(frame), 1), CSV_ROWS):
+        f.write(frame.iloc[a:a + CSV_ROWS].to_csv(index=index, header=header and not a))
+
+
+def write_edges(
+    f:IO[str],
+    matrix:SparseMatrix,
+    index_names:NameIndex,
+    column_names:NameIndex,
+    header:bool,
+    source:str="source",
+    target:str="target"
+):
+    """
+    writes the entries of a matrix as csv edges, formatting about CSV_ROWS entries
+    at a time so that memory does not grow with the matrix.
+    """
+    import pandas as pd
+    for k, chunk in enumerate(matrix.entry_chunks(CSV_ROWS)):
+        write_frame(f, pd.DataFrame(chunk.to_edges(index_names, column_names, source, target)), header and not k, False)
+
+
+def write_fileauthors(f:IO[str], fileauthors:FileAuthors, file_names:NameIndex, author_names:NameIndex, header:bool):
+    """
+    writes a fileauthors table as csv, CSV_ROWS files at a time.
+    """
+    for k, chunk in enumerate(fileauthors.row_chunks(CSV_ROWS)):
+        write_frame(f, chunk.to_frame(file_names, author_names), header and not k, True)
+
+
+def names_array(names:NameIndex) -> np.ndarray:
+    return np.array([names.prefix, names.sep, str(names.size)])
+
+
+def names_index(array:np.ndarray) -> NameIndex:
+    prefix, sep, size = [str(x) for x in array]
+    return NameIndex(prefix, int(size), sep=sep)
+
+
+def save_arrays(path:Path, arrays:dict):
+    """
+    Saves named arrays as an uncompressed .npz archive, or as a directory of .npy
+    files (which can be memory-mapped on load) if path has no suffix.
+    """
+    if path.suffix == ".npz":
+        np.savez(path, **arrays)
+        return
+    os.makedirs(path, exist_ok=True)
+    for key, array in arrays.items():
+        np.save(path / f"{key}.npy", array)
+
+
+def load_arrays(path:Path, mmap:bool=False) -> dict:
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path) as f:
+            return dict(f)
+    return {
+        f.stem: np.load(f, mmap_mode="r" if mmap else None)
+        for f in sorted(path.glob("*.npy"))
+    }
+
+
+def load_matrix(path:str, mmap:bool=False) -> Tuple[
+    Annotated[SparseMatrix, "matrix"],
+    Annotated[NameIndex, "index_names"],
+    Annotated[NameIndex, "column_names"]
+]:
+    """
+    Loads a matrix saved in a binary format by ArtifactStore, with the name indexes
+    of its rows and columns.
+    """
+    arrays = load_arrays(path, mmap=mmap)
+    matrix = SparseMatrix(arrays["indptr"], arrays["indices"], arrays["data"], arrays["index"], arrays["columns"])
+    return matrix, names_index(arrays["index_names"]), names_index(arrays["column_names"])
+
+
+def load_fileauthors(path:str, mmap:bool=False) -> Tuple[
+    Annotated[FileAuthors, "fileauthors"],
+    Annotated[NameIndex, "file_names"],
+    Annotated[NameIndex, "author_names"]
+]:
+    """
+    Loads a fileauthors table saved in a binary format by ArtifactStore.
+    """
+    arrays = load_arrays(path, mmap=mmap)
+    fileauthors = FileAuthors(arrays["files"], arrays["authors"], arrays["p"])
+    return fileauthors, names_index(arrays["file_names"]), names_index(arrays["author_names"])
+
+
+class ArtifactStore:
+    """
+    Writes the intermediate matrices of every repo to a directory.
+
+    "csv" writes edge lists labelled with the entity names, "npz" one uncompressed
+    archive per matrix and "npy" one directory of memory-mappable .npy files per
+    matrix. Binary formats keep the sparse arrays and integer ids together with the
+    name indexes needed to format them. "none" disables the artifacts.
+
+    Csv files are written by writer, on its background thread, if one is given.
+    """
+    __slots__ = ("path", "fmt", "writer")
+
+    def __init__(self, path:str="./tmp", fmt:str="csv", writer:Optional[BackgroundWriter]=None):
+        assert fmt in ARTIFACT_FORMATS, f"artifact format must be one of {ARTIFACT_FORMATS}"
+        self.path = Path(path)
+        self.fmt = fmt
+        self.writer = writer
+
+    def __getstate__(self):
+        # writers belong to the process that started them
+        return self.path, self.fmt
+
+    def __setstate__(self, state):
+        self.path, self.fmt = state
+        self.writer = None
+
+    def using(self, writer:Optional[BackgroundWriter]) -> "ArtifactStore":
+        """
+        returns a copy of the store writing its csv files with writer.
+        """
+        return ArtifactStore(self.path, self.fmt, writer)
+
+    def open(self, path:Path) -> IO[str]:
+        if self.writer is not None:
+            return self.writer.open(path)
+        return open(path, "w", buffering=WRITE_BUFFER)
+
+    @property
+    def enabled(self) -> bool:
+        return self.fmt != "none"
+
+    def prepare(self):
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+
+    def target(self, name:str, repo_id:Optional[str]=None) -> Path:
+        stem = name if repo_id is None else f"{name}_{repo_id}"
+        return self.path / f"{stem}{EXTENSIONS[self.fmt]}"
+
+    def save_matrix(
+        self,
+        name:str,
+        repo_id:Optional[str],
+        matrix:SparseMatrix,
+        index_names:NameIndex,
+        column_names:NameIndex,
+        source:str="source",
+        target:str="target"
+    ):
+        self.save_matrix_chunks(name, repo_id, [matrix], index_names, column_names, source, target)
+
+    def save_matrix_chunks(
+        self,
+        name:str,
+        repo_id:Optional[str],
+        chunks:Iterable[SparseMatrix],
+        index_names:NameIndex,
+        column_names:NameIndex,
+        source:str="source",
+        target:str="target"
+    ):
+        """
+        saves a matrix given as consecutive slices of rows. Csv files are written
+        one slice at a time, binary formats stack the slices first.
+        """
+        if not self.enabled:
+            return
+        path = self.target(name, repo_id)
+        if self.fmt == "csv":
+            with self.open(path) as f:
+                for k, chunk in enumerate(chunks):
+                    write_edges(f, chunk, index_names, column_names, not k, source, target)
+            return
+        chunks = list(chunks)
+        matrix = chunks[0] if len(chunks) == 1 else SparseMatrix.vstack(chunks)
+        save_arrays(path, {
+            "indptr": matrix.indptr,
+            "indices": matrix.indices,
+            "data": matrix.data,
+            "index": matrix.index,
+            "columns": matrix.columns,
+            "index_names": names_array(index_names),
+            "column_names": names_array(column_names),
+        })
+
+    def save_fileauthors(self, repo_id:Optional[str], fileauthors:FileAuthors, file_names:NameIndex, author_names:NameIndex):
+        if not self.enabled:
+            return
+        path = self.target("fileauthors", repo_id)
+        if self.fmt == "csv":
+            with self.open(path) as f:
+                write_fileauthors(f, fileauthors, file_names, author_names, True)
+            return
+        save_arrays(path, {
+            "files": fileauthors.index,
+            "authors": fileauthors.authors,
+            "p": fileauthors.p,
+            "file_names": names_array(file_names),
+            "author_names": names_array(author_names),
+        })
+
+    def save_file_batches(
+        self,
+        repo_id:Optional[str],
+        batches:Iterable[Tuple[SparseMatrix, FileAuthors]],
+        file_names:NameIndex,
+        author_names:NameIndex
+    ):
+        """
+        saves the file matrix and fileauthors table of a repo given as consecutive
+        diagonal blocks of files with their authors. Csv files are written one batch
+        at a time, CSV_ROWS rows being formatted at once, binary formats stack the
+        batches first.
+        """
+        if not self.enabled:
+            return
+        if self.fmt != "csv":
+            matrices, tables = zip(*batches)
+            self.save_matrix("filematrix", repo_id, SparseMatrix.block_diag(list(matrices)), file_names, file_names)
+            self.save_fileauthors(repo_id, FileAuthors.concat(list(tables)), file_names, author_names)
+            return
+        with self.open(self.target("filematrix", repo_id)) as filematrix_f, \
+                self.open(self.target("fileauthors", repo_id)) as fileauthors_f:
+            for k, (filematrix, fileauthors) in enumerate(batches):
+                write_edges(filematrix_f, filematrix, file_names, file_names, not k)
+                write_fileauthors(fileauthors_f, fileauthors, file_names, author_names, not k)
+
+    def concat(self, repos_list:list):
+        """
+        Builds the file matrix and fileauthors table of all the repos from the
+        per-repo artifacts. Repos do not share files, so the file matrices are
+        stacked block diagonally.
+        """
+        if not self.enabled:
+            return
+        filematrix_paths = [self.target("filematrix", repo_id) for repo_id in repos_list]
+        fileauthors_paths = [self.target("fileauthors", repo_id) for repo_id in repos_list]
+        if self.fmt == "csv":
+            concat_csv(filematrix_paths, self.target("filematrix"))
+            concat_csv(fileauthors_paths, self.target("fileauthors"))
+            return
+
+        matrices = [load_matrix(path) for path in filematrix_paths]
+        _, file_names, _ = matrices[0]
+        self.save_matrix("filematrix", None, SparseMatrix.block_diag([m for m, _, _ in matrices]), file_names, file_names)
+        tables = [load_arrays(path) for path in fileauthors_paths]
+        save_arrays(self.target("fileauthors"), {
+            key: np.concatenate([t[key] for t in tables]) if key in ("files", "authors", "p") else tables[0][key]
+            for key in tables[0]
+        })
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from src.metrics import Metrics
+
+# bump when the output of a stage changes for the same inputs, e.g. when a
+# sampler is rewritten, so stale entries are not reused
+CACHE_VERSION = 3
+
+
+def section(config:dict, name:str) -> dict:
+    """
+    returns the settings of a config section that affect the generated values.
+    Prefixes only affect the names, which are formatted on output.
+    """
+    return {key: value for key, value in config[name].items() if key != "prefix"}
+
+
+def _json_default(value:Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"cannot hash {type(value).__name__}")
+
+
+def digest(*parts:Any) -> str:
+    """
+    returns the sha256 hex digest of the given values. Arrays are hashed by dtype,
+    shape and content, other values by their JSON representation.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(f"ndarray:{part.dtype.str}:{part.shape}:".encode())
+            h.update(np.ascontiguousarray(part).data)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=_json_default).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    Content-addressed on-disk cache of stage outputs. An entry is keyed by the
+    stage name and the digest of everything the stage reads: the relevant config
+    section, the seed entropy and the upstream outputs. Changing a section only
+    invalidates the stages that read it, directly or through their inputs.
+
+    A cache without path is disabled and always computes.
+    """
+    __slots__ = ("path",)
+
+    def __init__(self, path:Optional[str]=None):
+        self.path = Path(path) if path is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def target(self, stage:str, key:str) -> Path:
+        return self.path / stage / f"{key}.pkl"
+
+    def fetch(self, stage:str, inputs:tuple, compute:Callable[[], Any], metrics:Optional[Metrics]=None) -> Any:
+        """
+        returns the cached output of stage for inputs, calling compute and storing
+        its result on a miss.
+        """
+        if not self.enabled:
+            return compute()
+        metrics = metrics or Metrics()
+        path = self.target(stage, digest(CACHE_VERSION, stage, *inputs))
+        if path.exists():
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            logging.debug(f"Cache hit {stage} {path.stem}")
+            metrics.increment("cache_hits")
+            return value
+
+        value = compute()
+        metrics.increment("cache_misses")
+        os.makedirs(path.parent, exist_ok=True)
+        # written aside and renamed, so concurrent workers never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return value
@@ -0,0 +1,309 @@
+import math
+from typing import Annotated, Optional, Tuple
+
+from src.generator import read_config, FILE_ENTRY_BYTES, FILE_BYTES, GROUP_CHUNK
+
+# memory of a process before any stage (python, numpy, yaml) and of pandas with
+# the frames of CSV_ROWS edges it formats csv artifacts with
+BASE_BYTES = 40 << 20
+PANDAS_BYTES = 48 << 20
+# memory held for the whole run by every file (ids, groups, repo split) and by
+# every module file selection
+SHARED_FILE_BYTES = 64
+SELECTION_BYTES = 16
+# memory of a repo by entry of its file matrix (CSR arrays and transitions) and by
+# file (author transition, labels) of a batch of groups, by entry of the chunk of
+# groups being sampled, and by entry of the Ungrouped block, which is sampled dense
+# and held whole
+ENTRY_BYTES = 52
+NODE_BYTES = 280
+SAMPLE_BYTES = 40
+UNGROUPED_BYTES = 64
+# memory by edge of the binary artifacts of a file matrix, stacked when the file
+# matrix is streamed and loaded and stacked again when the repos are concatenated
+BINARY_EDGE_BYTES = 16
+# characters of a formatted probability, e.g. 0.08086284478935912
+FLOAT_BYTES = 19
+# share of the entries of the ungrouped block above its threshold of 0.05 / n
+UNGROUPED_KEPT = math.exp(-0.05)
+# seconds by file of the shared stages, by file matrix entry, by module edge, by
+# byte of markov file, by csv edge, by byte of binary artifact and by byte copied
+# when artifacts are concatenated, measured on a single core
+PREPARE_SECONDS = 1.5e-7
+ENTRY_SECONDS = 8e-8
+MODULE_EDGE_SECONDS = 1e-6
+WRITE_SECONDS = 4.5e-8
+CSV_EDGE_SECONDS = 4.6e-6
+BINARY_SECONDS = 2e-9
+COPY_SECONDS = 1e-9
+
+
+def positive_poisson_moments(lam:float) -> Tuple[
+    Annotated[float, "mean"],
+    Annotated[float, "mean_square"]
+]:
+    """
+    returns the first two moments of the Poisson(lam) integers != 0 drawn by
+    sample_positive_poisson.
+    """
+    if lam <= 0:
+        return 1., 1.
+    nonzero = -math.expm1(-lam)
+    return lam / nonzero, (lam + lam * lam) / nonzero
+
+
+def largest_share(total:float, n_split:int) -> float:
+    """
+    returns a likely upper bound of the largest share of total split by
+    split_groups: n_split - 1 repos draw Poisson(total / n_split) shares and the
+    last one gets the rest, whose spread grows with n_split.
+    """
+    mean = total / n_split
+    return min(total, mean + 3 * math.sqrt(mean * (n_split - 1)))
+
+
+def name_bytes(prefix:str, sep:str, n:int) -> float:
+    """
+    returns the average length of the names of n entities, see NameIndex.
+    """
+    if n <= 0:
+        return 0.
+    digits, start = 0, 0
+    for d in range(1, len(str(n - 1)) + 1):
+        end = min(n, 10 ** d)
+        digits += d * (end - start)
+        start = end
+    return len(prefix) + len(sep) + digits / n
+
+
+def edge_bytes(tag:str, name:float) -> float:
+    """
+    returns the length of a transition of a markov file, e.g.
+    "    - to: !File File_3\\n      p: 0.25\\n".
+    """
+    return 41 + len(tag) + name
+
+
+def node_bytes(tag:str, name:float) -> float:
+    return 7 + len(tag) + name
+
+
+def repo_counts(config:dict, n_split:int, largest:bool=False) -> dict:
+    """
+    returns the expected counts of nodes and edges of a repo, or of the largest
+    repo, from the parameters of the configuration.
+    """
+    files = config["Files"]["number"]
+    groups = config["Files"]["filegroups"]
+    if groups["random"]:
+        size, size_square = positive_poisson_moments(groups["lenght"])
+    else:
+        size, size_square = groups["lenght"], groups["lenght"] ** 2
+    n_groups = min(groups["number"], math.ceil(files / size)) if size else 0
+    ungrouped = max(files - n_groups * size, 0)
+
+    share = (lambda total: largest_share(total, n_split)) if largest else (lambda total: total / n_split)
+    repo_groups, repo_ungrouped = share(n_groups), share(ungrouped)
+
+    modules = config["Modules"]["number"]
+    # generate_modules gives every module `number` files when it is not random
+    module_files = positive_poisson_moments(config["Modules"]["lambda"])[0] if config["Modules"]["random"] else modules
+    # chance of a module to select files of the repo
+    in_repo = 1 - (1 - 1 / n_split) ** module_files
+    issue_modules = positive_poisson_moments(config["Issues"]["n_modules"])[0]
+    issues = config["Issues"]["number"]
+
+    return {
+        "files": repo_groups * size + repo_ungrouped,
+        "groups": repo_groups,
+        "ungrouped_files": repo_ungrouped,
+        "group_entries": repo_groups * size_square,
+        "ungrouped_entries": repo_ungrouped ** 2,
+        "file_edges": repo_groups * size_square + repo_ungrouped ** 2 * UNGROUPED_KEPT,
+        "authors": min(config["Authors"]["number"], repo_groups + repo_ungrouped),
+        "modules": modules * in_repo,
+        "module_edges": modules * module_files / n_split,
+        "module_selections": modules * module_files,
+        "issues": issues * (1 - (1 - in_repo) ** issue_modules),
+        "issue_edges": issues * issue_modules * in_repo,
+    }
+
+
+def group_batches(repo:dict) -> Tuple[
+    Annotated[float, "entry_bytes"],
+    Annotated[float, "budget_bytes"],
+    Annotated[float, "chunk"]
+]:
+    """
+    returns the memory by entry of a batch of the groups of a repo, the memory
+    FileMatrixBatches counts for it against the memory budget, and the entries of a
+    chunk of groups, the smallest batch.
+    """
+    entries = repo["group_entries"]
+    files_per_entry = (repo["files"] - repo["ungrouped_files"]) / entries if entries else 0.
+    return (
+        ENTRY_BYTES + NODE_BYTES * files_per_entry,
+        FILE_ENTRY_BYTES + FILE_BYTES * files_per_entry,
+        min(entries, GROUP_CHUNK),
+    )
+
+
+def file_matrix_bytes(repo:dict, memory_budget:Optional[int]=None) -> Tuple[
+    Annotated[float, "file_matrix"],
+    Annotated[float, "minimum"]
+]:
+    """
+    returns the memory of the groups of a repo, held whole or in batches of about
+    memory_budget, and the memory of a batch of a single chunk of groups, the least
+    a streamed file matrix takes.
+    """
+    entry_bytes, budget_bytes, chunk = group_batches(repo)
+    batch = repo["group_entries"]
+    if memory_budget is not None:
+        batch = min(batch, max(chunk, memory_budget / budget_bytes))
+    return entry_bytes * batch + SAMPLE_BYTES * chunk, (entry_bytes + SAMPLE_BYTES) * chunk
+
+
+def markov_bytes(repo:dict, names:dict) -> float:
+    """
+    returns the expected size of the markov file of a repo.
+    """
+    return (
+        repo["issues"] * (node_bytes("!Issue", names["issue"]) + 5)
+        + node_bytes("!Initial", 1) + repo["issues"] * edge_bytes("!Issue", names["issue"])
+        + repo["issues"] * node_bytes("!Issue", names["issue"]) + repo["issue_edges"] * edge_bytes("!Module", names["module"])
+        + repo["files"] * node_bytes("!File", names["file"]) + repo["file_edges"] * edge_bytes("!File", names["file"])
+        + repo["files"] * edge_bytes("!Author", names["author"])
+        + repo["modules"] * node_bytes("!Module", names["module"]) + repo["module_edges"] * edge_bytes("!File", names["file"])
+        + repo["authors"] * (node_bytes("!Author", names["author"]) + 32)
+    )
+
+
+def artifact_bytes(repo:dict, names:dict, fmt:str) -> float:
+    """
+    returns the expected size of the artifacts of a repo, the file matrix and the
+    fileauthors table being also copied by ArtifactStore.concat.
+    """
+    if fmt == "none":
+        return 0.
+    if fmt == "csv":
+        files = repo["file_edges"] * (2 * names["file"] + FLOAT_BYTES + 3)
+        files += repo["files"] * (names["file"] + names["author"] + FLOAT_BYTES + 3)
+        return (
+            2 * files
+            + repo["module_edges"] * (names["module"] + names["file"] + FLOAT_BYTES + 3)
+            + repo["issue_edges"] * (names["issue"] + names["module"] + FLOAT_BYTES + 3)
+        )
+    # indices and values of the entries, ids and indptr of the rows
+    files = 16 * repo["file_edges"] + 40 * repo["files"]
+    return 2 * files + 16 * (repo["module_edges"] + repo["issue_edges"]) + 16 * (repo["modules"] + repo["issues"])
+
+
+def estimate_run(
+    path_to_config:"str | dict",
+    n_split:int,
+    workers:int=1,
+    tmp_format:str="csv",
+    memory_budget:Optional[int]=None
+) -> dict:
+    """
+    Predicts the sizes, peak memory and stage timings of generate_markov from the
+    parameters of the configuration only, without generating anything. Counts are
+    expected values; memory is predicted for the largest repo, which holds the
+    largest Ungrouped block. With a memory_budget (in bytes, per worker) the file
+    matrices are streamed, but the Ungrouped block is always held whole.
+    """
+    config = read_config(path_to_config)
+    repo = repo_counts(config, n_split)
+    largest = repo_counts(config, n_split, largest=True)
+    names = {
+        "file": name_bytes(config["Files"]["prefix"], "_", config["Files"]["number"]),
+        "module": name_bytes(config["Modules"]["prefix"], "_", config["Modules"]["number"]),
+        "author": name_bytes(config["Authors"]["prefix"], "_", config["Authors"]["number"]),
+        "issue": name_bytes(config["Issues"]["prefix"], "", config["Issues"]["number"]),
+    }
+    processes = min(workers, n_split)
+
+    shared = SHARED_FILE_BYTES * config["Files"]["number"] + SELECTION_BYTES * largest["module_selections"]
+    file_matrix, _ = file_matrix_bytes(largest, memory_budget)
+    ungrouped = UNGROUPED_BYTES * largest["ungrouped_entries"] + NODE_BYTES * largest["ungrouped_files"]
+    # csv artifacts are formatted CSV_ROWS edges at a time
+    csv = PANDAS_BYTES if tmp_format == "csv" else 0.
+    binary = tmp_format in ("npz", "npy")
+    # binary artifacts stack the batches of a streamed file matrix
+    stacked = BINARY_EDGE_BYTES * largest["file_edges"] if binary and memory_budget is not None else 0.
+    worker = BASE_BYTES + shared + file_matrix + ungrouped + csv + stacked
+    # with a pool the main process only holds the shared stages
+    main = BASE_BYTES + shared if processes > 1 else 0.
+    # then it concatenates the binary artifacts of every repo
+    concat = BASE_BYTES + shared + 2 * BINARY_EDGE_BYTES * n_split * repo["file_edges"] if binary else 0.
+
+    repo_bytes = markov_bytes(repo, names)
+    artifacts = artifact_bytes(repo, names, tmp_format)
+    entries = repo["group_entries"] + repo["ungrouped_entries"]
+    file_seconds = ENTRY_SECONDS * entries * (2 if memory_budget is not None and tmp_format != "none" else 1)
+    if tmp_format == "csv":
+        artifact_seconds = CSV_EDGE_SECONDS * (repo["file_edges"] + repo["files"] + repo["module_edges"] + repo["issue_edges"])
+    else:
+        artifact_seconds = BINARY_SECONDS * artifacts
+    seconds = {
+        "prepare_data": PREPARE_SECONDS * config["Files"]["number"],
+        "generate_file_matrix": n_split * file_seconds / processes,
+        "generate_module_matrix": n_split * MODULE_EDGE_SECONDS * repo["module_edges"] / processes,
+        "save_artifacts": n_split * artifact_seconds / processes,
+        "write_markov": n_split * WRITE_SECONDS * repo_bytes / processes,
+        "concat_artifacts": COPY_SECONDS * n_split * artifacts / 2,
+    }
+    seconds["total"] = sum(seconds.values())
+
+    return {
+        "repos": n_split,
+        "workers": processes,
+        "tmp_format": tmp_format,
+        "memory_budget": memory_budget,
+        "repo": {key: round(value, 1) for key, value in repo.items()},
+        "largest_repo": {key: round(value, 1) for key, value in largest.items()},
+        "edges": round(n_split * (repo["file_edges"] + repo["files"] + repo["module_edges"] + repo["issue_edges"] + repo["issues"])),
+        "output_bytes": round(n_split * repo_bytes),
+        "artifact_bytes": round(n_split * artifacts),
+        "memory_bytes": {
+            "shared": round(shared),
+            "file_matrix": round(file_matrix),
+            "ungrouped": round(ungrouped),
+            "csv": round(csv),
+            "stacked": round(stacked),
+            "worker": round(worker),
+            "main": round(main),
+            "concat": round(concat),
+            "total": round(max(main + processes * worker, concat)),
+        },
+        "seconds": {stage: round(value, 2) for stage, value in seconds.items()},
+    }
+
+
+def memory_budget_for(estimate:dict, max_memory:int) -> Optional[int]:
+    """
+    returns None if the run of estimate fits in max_memory bytes with the file
+    matrices held whole, otherwise the largest memory budget per worker under
+    which it fits. A batch holds at least a chunk of groups, so the run cannot fit,
+    and ValueError is raised, if that budget is below one chunk, typically because
+    the Ungrouped block alone is too large.
+    """
+    memory = estimate["memory_bytes"]
+    if memory["total"] <= max_memory:
+        return None
+    workers = estimate["workers"]
+    fixed = BASE_BYTES + memory["shared"] + memory["ungrouped"] + memory["csv"]
+    if estimate["tmp_format"] in ("npz", "npy"):
+        fixed += BINARY_EDGE_BYTES * estimate["largest_repo"]["file_edges"]
+    _, minimum = file_matrix_bytes(estimate["largest_repo"])
+    needed = max(memory["main"] + workers * (fixed + minimum), memory["concat"])
+    if needed > max_memory:
+        raise ValueError(
+            f"The run needs at least {math.ceil(needed / 2**20)}MB, {math.ceil((fixed + minimum) / 2**20)}MB per worker "
+            f"with streamed file matrices of which {math.ceil(memory['ungrouped'] / 2**20)}MB for the Ungrouped block, "
+            f"more than {max_memory / 2**20:g}MB."
+        )
+    entry_bytes, budget_bytes, chunk = group_batches(estimate["largest_repo"])
+    available = (max_memory - memory["main"]) / workers - fixed - SAMPLE_BYTES * chunk
+    return int(available / entry_bytes * budget_bytes)
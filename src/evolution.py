@@ -0,0 +1,544 @@
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import yaml
+
+from src.ids import IdTable, NameIndex, UNGROUPED
+from src.sparse import SparseMatrix, FileAuthors
+from src.rng import RandomStreams
+from src.artifacts import ArtifactStore, save_arrays, load_arrays
+from src.issues import select_issue_modules, generate_issue_chunk
+from src.sampling import sample_positive_poisson, sample_ungrouped_block, sample_simplex_rows
+from src.metrics import Metrics
+from src.validation import Validator
+from src.generator import prepare_data, map_repos, sample_group_chunk
+from src.model import MarkovModel, issue_draws, repo_model, save_models
+
+# every change of a step draws from its own stream, keyed by the step, the code of
+# the change and, for the draws of a repo, the repo number
+CHANGES = {
+    "authors": 0,
+    "remove_groups": 1,
+    "remove_files": 2,
+    "add_groups": 3,
+    "add_ungrouped": 4,
+    "module_files": 5,
+    "add_modules": 6,
+    "add_issues": 7,
+}
+# changes a delta can hold, by section of the configuration
+DELTA_KEYS = {
+    "Files": ("remove_groups", "remove_files", "add_groups", "add_ungrouped"),
+    "Modules": ("add",),
+    "Issues": ("add",),
+    "Authors": ("add", "weights"),
+}
+SNAPSHOT_FILE = "snapshot.yaml"
+
+
+def filter_entries(matrix:SparseMatrix, keep:np.ndarray) -> SparseMatrix:
+    """
+    returns the matrix with the stored entries where keep is True, rows and
+    columns unchanged.
+    """
+    indptr = np.zeros(len(matrix.index) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(matrix.row_ids()[keep], minlength=len(matrix.index)), out=indptr[1:])
+    return SparseMatrix(indptr, matrix.indices[keep], matrix.data[keep], matrix.index, matrix.columns)
+
+
+def rescale_rows(matrix:SparseMatrix, rows:np.ndarray, targets:np.ndarray):
+    """
+    scales the non-empty rows where rows is True so that they sum to targets, the
+    other rows are left untouched.
+    """
+    sums = matrix.row_sums()
+    scaled = rows & (sums > 0)
+    scale = np.ones(len(sums))
+    scale[scaled] = targets[scaled] / sums[scaled]
+    matrix.data *= scale[matrix.row_ids()]
+
+
+class RepoState:
+    """
+    Matrices of a repo in a Snapshot: the file matrix with the FileGroup of every
+    file (UNGROUPED for the Ungrouped block) and its author transitions, the module
+    matrix over every module, and the non-empty rows of the issue matrix with the
+    average consecutive commits, the weight and the Initial probability of every
+    issue. Evolution steps replace the blocks they change and keep the others.
+    """
+    __slots__ = (
+        "filematrix", "fileauthors", "file_group", "modulematrix",
+        "issuematrix", "average_consecutive_commits", "weights", "initial",
+    )
+
+    def __init__(
+        self,
+        filematrix:SparseMatrix,
+        fileauthors:FileAuthors,
+        file_group:np.ndarray,
+        modulematrix:SparseMatrix,
+        issuematrix:SparseMatrix,
+        average_consecutive_commits:np.ndarray,
+        weights:np.ndarray,
+        initial:np.ndarray
+    ):
+        assert len(file_group) == len(fileauthors) == len(filematrix.index), "every file needs a group and an author."
+        assert len(average_consecutive_commits) == len(weights) == len(initial) == len(issuematrix.index)
+        self.filematrix = filematrix
+        self.fileauthors = fileauthors
+        self.file_group = file_group
+        self.modulematrix = modulematrix
+        self.issuematrix = issuematrix
+        self.average_consecutive_commits = average_consecutive_commits
+        self.weights = weights
+        self.initial = initial
+
+    def to_arrays(self) -> dict:
+        return {
+            "file_indptr": self.filematrix.indptr,
+            "file_indices": self.filematrix.indices,
+            "file_data": self.filematrix.data,
+            "files": self.filematrix.index,
+            "authors": self.fileauthors.authors,
+            "author_p": self.fileauthors.p,
+            "file_group": self.file_group,
+            "module_indptr": self.modulematrix.indptr,
+            "module_indices": self.modulematrix.indices,
+            "module_data": self.modulematrix.data,
+            "issue_indptr": self.issuematrix.indptr,
+            "issue_indices": self.issuematrix.indices,
+            "issue_data": self.issuematrix.data,
+            "issues": self.issuematrix.index,
+            "average_consecutive_commits": self.average_consecutive_commits,
+            "weights": self.weights,
+            "initial": self.initial,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays:dict, n_files:int, n_modules:int) -> "RepoState":
+        files = arrays["files"]
+        return cls(
+            SparseMatrix(arrays["file_indptr"], arrays["file_indices"], arrays["file_data"], files, files),
+            FileAuthors(files, arrays["authors"], arrays["author_p"]),
+            arrays["file_group"],
+            SparseMatrix(
+                arrays["module_indptr"], arrays["module_indices"], arrays["module_data"],
+                np.arange(len(arrays["module_indptr"]) - 1), np.arange(n_files)
+            ),
+            SparseMatrix(arrays["issue_indptr"], arrays["issue_indices"], arrays["issue_data"], arrays["issues"], np.arange(n_modules)),
+            arrays["average_consecutive_commits"],
+            arrays["weights"],
+            arrays["initial"],
+        )
+
+    def drop_files(self, keep:np.ndarray, rescale:bool=True):
+        """
+        drops the rows and columns of the files of the file matrix where keep is
+        False. With rescale the rows that lost transitions are scaled back to their
+        sum, 1 minus their author transition, or go to their author only if none
+        is left.
+        """
+        matrix = self.filematrix
+        lost = np.bincount(matrix.row_ids(), weights=~keep[matrix.indices], minlength=len(keep))[keep] > 0
+        matrix = filter_entries(matrix, keep[matrix.indices]).take_rows(np.flatnonzero(keep))
+        matrix.indices = (np.cumsum(keep) - 1)[matrix.indices]
+        matrix.columns = matrix.index
+        p = self.fileauthors.p[keep]
+        if rescale:
+            rescale_rows(matrix, lost, 1 - p)
+            p = np.where(lost & (matrix.row_sums() == 0), 1., p)
+        self.filematrix = matrix
+        self.fileauthors = FileAuthors(matrix.index, self.fileauthors.authors[keep], p)
+        self.file_group = self.file_group[keep]
+
+    def drop_module_files(self, removed:np.ndarray):
+        """
+        drops the removed files (a mask over file ids) from the module rows, which
+        are renormalized.
+        """
+        matrix = self.modulematrix
+        dropped = removed[matrix.columns[matrix.indices]]
+        if not dropped.any():
+            return
+        lost = np.bincount(matrix.row_ids()[dropped], minlength=len(matrix.index)) > 0
+        matrix = filter_entries(matrix, ~dropped)
+        rescale_rows(matrix, lost, np.ones(len(lost)))
+        self.modulematrix = matrix
+
+    def append_files(self, filematrix:SparseMatrix, fileauthors:FileAuthors, file_group:np.ndarray):
+        """
+        appends a block of new files on the diagonal of the file matrix.
+        """
+        self.filematrix = SparseMatrix.block_diag([self.filematrix, filematrix])
+        self.fileauthors = FileAuthors.concat([self.fileauthors, fileauthors])
+        self.file_group = np.concatenate([self.file_group, file_group])
+
+    def redraw_modules(self, rng:np.random.Generator, modules:np.ndarray, files:np.ndarray, n_modules:int, n_files:int):
+        """
+        adds the (module, file) selections of the repo to its module matrix, whose
+        rows now have n_modules modules, and redraws the rows they touch. The other
+        rows are kept as they are.
+        """
+        matrix = self.modulematrix
+        rows = matrix.index[matrix.row_ids()]
+        cols = matrix.columns[matrix.indices]
+        redrawn = np.isin(rows, modules)
+        new_rows = np.concatenate([rows[redrawn], modules])
+        order = np.argsort(new_rows, kind="stable")
+        new_rows = new_rows[order]
+        new_cols = np.concatenate([cols[redrawn], files])[order]
+        p = sample_simplex_rows(rng, new_rows, n_modules, "module")
+        self.modulematrix = SparseMatrix.from_coo(
+            np.concatenate([rows[~redrawn], new_rows]),
+            np.concatenate([cols[~redrawn], new_cols]),
+            np.concatenate([matrix.data[~redrawn], p]),
+            np.arange(n_modules),
+            np.arange(n_files)
+        )
+
+    def append_issues(self, issuematrix:SparseMatrix, average_consecutive_commits:np.ndarray, weights:np.ndarray, n_modules:int):
+        """
+        appends the rows of new issues, the Initial probabilities being renormalized
+        over every issue.
+        """
+        self.issuematrix = SparseMatrix.vstack([self.issuematrix, issuematrix])
+        self.issuematrix.columns = np.arange(n_modules)
+        self.average_consecutive_commits = np.concatenate([self.average_consecutive_commits, average_consecutive_commits])
+        self.weights = np.concatenate([self.weights, weights])
+        self.initial = self.weights / self.weights.sum()
+
+
+class Snapshot:
+    """
+    State of a generated project that evolution steps start from: the config and
+    the seed it was generated from, the contribution of every author, the names of
+    the entities (whose numbers only grow, removed files keep their id) and the
+    matrices of every repo. ids only holds the name indexes, the repos and the repo
+    of every file (-1 for removed files), which is what the markov models and the
+    Validator read.
+    """
+    __slots__ = ("config", "entropy", "step", "deltas", "ids", "contribution", "repos")
+
+    def __init__(self, config:dict, entropy:int, step:int, deltas:list, ids:IdTable, contribution:np.ndarray, repos:list):
+        self.config = config
+        self.entropy = entropy
+        self.step = step
+        self.deltas = deltas
+        self.ids = ids
+        self.contribution = contribution
+        self.repos = repos
+        self.ids.file_repo = np.full(len(ids.files), -1, dtype=np.int64)
+        for r, state in enumerate(repos):
+            self.ids.file_repo[state.filematrix.index] = r
+
+    @staticmethod
+    def id_table(config:dict, n_files:int, n_groups:int, n_modules:int, n_authors:int, n_issues:int, n_repos:int) -> IdTable:
+        ids = IdTable(
+            files=NameIndex(config["Files"]["prefix"], n_files),
+            groups=NameIndex("FileGroup", n_groups, sep=""),
+            modules=NameIndex(config["Modules"]["prefix"], n_modules),
+            authors=NameIndex(config["Authors"]["prefix"], n_authors),
+            issues=NameIndex(config["Issues"]["prefix"], n_issues, sep=""),
+        )
+        ids.repos = NameIndex("Repo", n_repos)
+        return ids
+
+    @classmethod
+    def generate(
+        cls,
+        config:"str | dict",
+        n_split:int=1,
+        seed:Optional[int]=None,
+        workers:int=1,
+        metrics:Optional[Metrics]=None,
+        validator:Optional[Validator]=None
+    ) -> "Snapshot":
+        """
+        Generates the first snapshot of a project, whose models are the ones
+        generate_models returns for the same seed.
+        """
+        metrics = metrics or Metrics()
+        validator = validator or Validator()
+        streams = RandomStreams(seed)
+        data = prepare_data(config, n_split, streams, metrics)
+        config, ids, authors = data[0], data[1], data[2]
+        results = map_repos(data, streams, ArtifactStore(fmt="none"), None, workers, metrics, validator=validator)
+        validator.raise_on_violations()
+        repos = []
+        for r, (filematrix, fileauthors, modulematrix, issuematrix) in enumerate(results):
+            draws = issue_draws(streams, r, config["Issues"]["lambda"], issuematrix)
+            repos.append(RepoState(filematrix, fileauthors, ids.file_group[filematrix.index], modulematrix, *draws))
+        ids = cls.id_table(config, len(ids.files), len(ids.groups), len(ids.modules), len(ids.authors), len(ids.issues), n_split)
+        return cls(config, int(streams.entropy), 0, [], ids, authors, repos)
+
+    def models(self) -> list[MarkovModel]:
+        return [
+            repo_model(
+                self.ids, r, state.issuematrix, state.average_consecutive_commits, state.initial,
+                state.filematrix, state.fileauthors, state.modulematrix
+            )
+            for r, state in enumerate(self.repos)
+        ]
+
+    def validate(self, validator:Optional[Validator]=None) -> Validator:
+        """
+        checks the matrices of every repo and the sum of their Initial node.
+        """
+        validator = validator or Validator()
+        for r, state in enumerate(self.repos):
+            repo_id = self.ids.repos.name(r)
+            validator.check_files(repo_id, self.ids, r, state.filematrix, state.fileauthors)
+            validator.check_modules(repo_id, self.ids, r, state.modulematrix)
+            validator.check_issues(repo_id, self.ids, state.issuematrix)
+            validator.check_initial(repo_id, state.initial.sum())
+        return validator
+
+    def save(self, path:str) -> Path:
+        """
+        writes the snapshot to path: snapshot.yaml with the config, the seed, the
+        counts of entities and the deltas applied so far, and one npz archive of the
+        matrices of every repo.
+        """
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        for r, state in enumerate(self.repos):
+            save_arrays(path / f"{self.ids.repos.name(r)}.npz", state.to_arrays())
+        content = {
+            "step": self.step,
+            "entropy": self.entropy,
+            "files": len(self.ids.files),
+            "groups": len(self.ids.groups),
+            "modules": len(self.ids.modules),
+            "issues": len(self.ids.issues),
+            "repos": len(self.repos),
+            "contribution": self.contribution.tolist(),
+            "deltas": self.deltas,
+            "config": self.config,
+        }
+        with open(path / SNAPSHOT_FILE, "w") as f:
+            yaml.safe_dump(content, f, sort_keys=False)
+        return path
+
+    @classmethod
+    def load(cls, path:str) -> "Snapshot":
+        path = Path(path)
+        with open(path / SNAPSHOT_FILE, "r") as f:
+            content = yaml.safe_load(f)
+        contribution = np.array(content["contribution"], dtype=float)
+        ids = cls.id_table(
+            content["config"], content["files"], content["groups"], content["modules"], len(contribution),
+            content["issues"], content["repos"]
+        )
+        repos = [
+            RepoState.from_arrays(load_arrays(path / f"{ids.repos.name(r)}.npz"), len(ids.files), len(ids.modules))
+            for r in range(content["repos"])
+        ]
+        return cls(content["config"], content["entropy"], content["step"], content["deltas"], ids, contribution, repos)
+
+
+def read_delta(delta:dict) -> dict:
+    """
+    checks the sections and changes of a delta.
+    """
+    delta = delta or {}
+    for section, changes in delta.items():
+        assert section in DELTA_KEYS, f"delta sections must be in {tuple(DELTA_KEYS)}, got {section}."
+        unknown = set(changes or {}) - set(DELTA_KEYS[section])
+        assert not unknown, f"{section} changes must be in {DELTA_KEYS[section]}, got {sorted(unknown)}."
+    return delta
+
+
+def reassign_authors(streams:RandomStreams, step:int, snapshot:Snapshot, contribution:np.ndarray):
+    """
+    Moves the authors of the groups and ungrouped files to the new contribution with
+    as few changes as possible: a unit keeps its author a with probability
+    min(1, contribution[a] / previous[a]), otherwise it draws a new author from the
+    contribution gained by the others, so authors are distributed by contribution.
+    """
+    previous = np.zeros(len(contribution))
+    previous[:len(snapshot.contribution)] = snapshot.contribution
+    gained = np.maximum(contribution - previous, 0.)
+    if gained.sum() <= 0:
+        return
+    kept = np.minimum(1., contribution / np.where(previous > 0, previous, 1.))
+    for r, state in enumerate(snapshot.repos):
+        rng = streams.generator("evolution", step, CHANGES["authors"], r)
+        # the files of a group share its author
+        units = np.where(state.file_group != UNGROUPED, state.file_group, len(snapshot.ids.groups) + state.fileauthors.index)
+        _, first, inverse = np.unique(units, return_index=True, return_inverse=True)
+        authors = state.fileauthors.authors[first]
+        moved = np.flatnonzero(rng.random(len(authors)) >= kept[authors])
+        authors[moved] = rng.choice(len(contribution), size=len(moved), p=gained / gained.sum())
+        state.fileauthors = FileAuthors(state.fileauthors.index, authors[inverse], state.fileauthors.p)
+
+
+def evolve(snapshot:Snapshot, delta:dict, validator:Optional[Validator]=None) -> Snapshot:
+    """
+    Applies a delta to a snapshot and returns the next one, the given snapshot being
+    modified. Only the blocks a change touches are redrawn: the blocks of removed,
+    added or reassigned groups, the Ungrouped block of the repos that get new
+    ungrouped files, the module rows that lose or gain files and the rows of new
+    issues. Changes are applied in the order of DELTA_KEYS, each from its own stream.
+    """
+    delta = read_delta(delta)
+    step = snapshot.step + 1
+    streams = RandomStreams(snapshot.entropy)
+    config, ids = snapshot.config, snapshot.ids
+    files, modules, authors, issues = (delta.get(section) or {} for section in ("Files", "Modules", "Authors", "Issues"))
+    n_files, n_groups, n_modules, n_issues = len(ids.files), len(ids.groups), len(ids.modules), len(ids.issues)
+
+    live = np.flatnonzero(ids.file_repo >= 0)
+    # module selections per live file, which new files draw in average
+    selections = sum(state.modulematrix.nnz for state in snapshot.repos) / max(len(live), 1)
+
+    if authors:
+        contribution = np.concatenate([snapshot.contribution, np.full(authors.get("add", 0), 1 / len(snapshot.contribution))])
+        names = NameIndex(ids.authors.prefix, len(contribution), ids.authors.sep)
+        for name, factor in (authors.get("weights") or {}).items():
+            contribution[names.id(name)] *= factor
+        contribution /= contribution.sum()
+        reassign_authors(streams, step, snapshot, contribution)
+        ids.authors = names
+        snapshot.contribution = contribution
+
+    removed = np.zeros(n_files, dtype=bool)
+    if files.get("remove_groups", 0):
+        groups = np.unique(np.concatenate([state.file_group for state in snapshot.repos]))
+        groups = groups[groups != UNGROUPED]
+        rng = streams.generator("evolution", step, CHANGES["remove_groups"])
+        groups = rng.choice(groups, size=min(files["remove_groups"], len(groups)), replace=False)
+        for state in snapshot.repos:
+            keep = ~np.isin(state.file_group, groups)
+            removed[state.filematrix.index[~keep]] = True
+            state.drop_files(keep)
+    if files.get("remove_files", 0):
+        left = live[~removed[live]]
+        rng = streams.generator("evolution", step, CHANGES["remove_files"])
+        removed[rng.choice(left, size=min(files["remove_files"], len(left)), replace=False)] = True
+        for state in snapshot.repos:
+            state.drop_files(~removed[state.filematrix.index])
+    for state in snapshot.repos:
+        state.drop_module_files(removed)
+
+    n_repos = len(snapshot.repos)
+    new_files = []
+    if files.get("add_groups", 0):
+        rng = streams.generator("evolution", step, CHANGES["add_groups"])
+        n, groups = files["add_groups"], config["Files"]["filegroups"]
+        if groups["random"]:
+            sizes = sample_positive_poisson(rng, groups["lenght"], n)
+            p = rng.normal(loc=groups["p"], scale=0.01, size=n)
+        else:
+            sizes = np.full(n, groups["lenght"], dtype=np.int64)
+            p = np.full(n, groups["p"], dtype=float)
+        assert bool((p > .0).all()) and bool((p < 1.).all()), "p must be in (0, 1)"
+        group_repo = rng.integers(n_repos, size=n)
+        drawn = rng.choice(len(snapshot.contribution), size=n, p=snapshot.contribution)
+        starts = n_files + np.cumsum(sizes) - sizes
+        for r in np.unique(group_repo).tolist():
+            groups_r = np.flatnonzero(group_repo == r)
+            sizes_r = sizes[groups_r]
+            files_r = np.repeat(starts[groups_r] - (np.cumsum(sizes_r) - sizes_r), sizes_r) + np.arange(sizes_r.sum())
+            indptr, indices, data = sample_group_chunk(streams.generator("evolution", step, CHANGES["add_groups"], r), sizes_r, p[groups_r])
+            snapshot.repos[r].append_files(
+                SparseMatrix(indptr, indices, data, files_r, files_r),
+                FileAuthors(files_r, np.repeat(drawn[groups_r], sizes_r), np.repeat(1 - p[groups_r], sizes_r)),
+                np.repeat(n_groups + groups_r, sizes_r)
+            )
+            new_files.append((files_r, np.full(len(files_r), r)))
+        n_files, n_groups = n_files + int(sizes.sum()), n_groups + n
+    if files.get("add_ungrouped", 0):
+        rng = streams.generator("evolution", step, CHANGES["add_ungrouped"])
+        n = files["add_ungrouped"]
+        file_repo = rng.integers(n_repos, size=n)
+        drawn = rng.choice(len(snapshot.contribution), size=n, p=snapshot.contribution)
+        for r in np.unique(file_repo).tolist():
+            state = snapshot.repos[r]
+            # the Ungrouped block is dense, so it is redrawn over the old and new files
+            old = state.file_group == UNGROUPED
+            files_r = n_files + np.flatnonzero(file_repo == r)
+            ungrouped = np.concatenate([state.filematrix.index[old], files_r])
+            authors_r = np.concatenate([state.fileauthors.authors[old], drawn[file_repo == r]])
+            state.drop_files(~old, rescale=False)
+            A = sample_ungrouped_block(streams.generator("evolution", step, CHANGES["add_ungrouped"], r), len(ungrouped))
+            state.append_files(
+                SparseMatrix.from_dense(A, ungrouped, ungrouped),
+                FileAuthors(ungrouped, authors_r, 1 - A.sum(axis=1)),
+                np.full(len(ungrouped), UNGROUPED, dtype=np.int64)
+            )
+            new_files.append((files_r, np.full(len(files_r), r)))
+        n_files += n
+
+    ids.files = NameIndex(ids.files.prefix, n_files, ids.files.sep)
+    ids.groups = NameIndex(ids.groups.prefix, n_groups, ids.groups.sep)
+    ids.file_repo = np.full(n_files, -1, dtype=np.int64)
+    for r, state in enumerate(snapshot.repos):
+        ids.file_repo[state.filematrix.index] = r
+
+    # (module, file) selections: new files join existing modules, new modules pick
+    # their files among every live file
+    module_rows, module_files = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    if new_files:
+        added = np.concatenate([f for f, _ in new_files])
+        rng = streams.generator("evolution", step, CHANGES["module_files"])
+        counts = rng.poisson(selections, size=len(added))
+        module_rows.append(rng.integers(n_modules, size=int(counts.sum())))
+        module_files.append(np.repeat(added, counts))
+    if modules.get("add", 0):
+        rng = streams.generator("evolution", step, CHANGES["add_modules"])
+        n = modules["add"]
+        if config["Modules"]["random"]:
+            counts = sample_positive_poisson(rng, config["Modules"]["lambda"], n)
+        else:
+            counts = np.full(n, config["Modules"]["lambda"], dtype=np.int64)
+        module_rows.append(np.repeat(n_modules + np.arange(n), counts))
+        module_files.append(rng.choice(np.flatnonzero(ids.file_repo >= 0), size=int(counts.sum()), replace=True))
+        n_modules += n
+        ids.modules = NameIndex(ids.modules.prefix, n_modules, ids.modules.sep)
+    module_rows, module_files = np.concatenate(module_rows), np.concatenate(module_files)
+    if len(module_rows) or modules.get("add", 0):
+        file_repo = ids.file_repo[module_files]
+        for r, state in enumerate(snapshot.repos):
+            rng = streams.generator("evolution", step, CHANGES["module_files"], r)
+            state.redraw_modules(rng, module_rows[file_repo == r], module_files[file_repo == r], n_modules, n_files)
+
+    if issues.get("add", 0):
+        n = issues["add"]
+        rng = streams.generator("evolution", step, CHANGES["add_issues"])
+        issue_indptr, issue_modules = select_issue_modules(rng, n, n_modules, config["Issues"]["n_modules"])
+        lam = config["Issues"]["lambda"]
+        for r, state in enumerate(snapshot.repos):
+            rng = streams.generator("evolution", step, CHANGES["add_issues"], r)
+            # as in generate_issue_matrix, issues can target every module in every repo
+            issuematrix = generate_issue_chunk(rng, n_issues, issue_indptr, issue_modules, np.ones(n_modules, dtype=bool))
+            state.append_issues(issuematrix, sample_positive_poisson(rng, lam, n).astype(float), rng.standard_exponential(n), n_modules)
+        n_issues += n
+        ids.issues = NameIndex(ids.issues.prefix, n_issues, ids.issues.sep)
+
+    logging.info(
+        f"Step {step}: {int((ids.file_repo >= 0).sum())} files, {n_groups} groups, {n_modules} modules, "
+        f"{len(ids.authors)} authors, {n_issues} issues"
+    )
+    evolved = Snapshot(config, snapshot.entropy, step, snapshot.deltas + [delta], ids, snapshot.contribution, snapshot.repos)
+    validator = evolved.validate(validator)
+    validator.raise_on_violations()
+    return evolved
+
+
+def evolve_series(snapshot:Snapshot, deltas:list, path_to_output:str, validator:Optional[Validator]=None) -> list[Path]:
+    """
+    Applies the deltas one after the other, writing the markov files and the
+    snapshot of every step to step_<n> in path_to_output, the given snapshot
+    included. Returns the directories of the steps.
+    """
+    paths = []
+    for delta in [None] + list(deltas):
+        if delta is not None:
+            snapshot = evolve(snapshot, delta, validator)
+        path = Path(path_to_output) / f"step_{snapshot.step}"
+        save_models(snapshot.models(), path)
+        paths.append(snapshot.save(path))
+        logging.info(f"Step {snapshot.step} saved {path}")
+    return paths
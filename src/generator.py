@@ -1,21 +1,42 @@
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import yaml
-from typing import Optional, Annotated, Tuple
+from typing import Optional, Annotated, Iterator, Tuple
 import numpy as np
-import pandas as pd
 
 from src.tags import *
-
-OUTPUT_ROUNDING = 6
-
-def get_random_num(lam:float=1.5) -> int:
+from src.sparse import SparseMatrix, FileAuthors
+from src.writer import MarkovWriter, BackgroundWriter, WRITE_QUEUE, open_markov, tagged
+from src.transitions import TransitionStore, TransitionStoreBuilder
+from src.issues import ISSUE_CHUNK, IssueChunks, IssueMatrix
+from src.rng import RandomStreams
+from src.ids import IdTable, NameIndex
+from src.artifacts import ArtifactStore
+from src.metrics import Metrics, Progress, peak_rss
+from src.cache import StageCache, section
+from src.validation import OUTPUT_ROUNDING, Validator
+from src.sampling import (
+    sample_positive_poisson, sample_group_blocks, sample_ungrouped_block, sample_simplex_rows, get_retries, reset_retries
+)
+
+# bytes held by every entry of a file matrix block (the dense block sampled and its
+# compressed index and value) and by every file of a batch (its author transition,
+# the per-block arrays and its formatted label when written)
+FILE_ENTRY_BYTES = 24
+FILE_BYTES = 512
+# file groups are sampled in chunks of consecutive groups of about GROUP_CHUNK
+# transitions, each drawing from its own stream, so the file matrix does not depend
+# on how chunks are batched together
+GROUP_CHUNK = 1 << 20
+
+def get_random_num(rng:np.random.Generator, lam:float=1.5) -> int:
     """
     returns a random integer != 0
     """
     while True:
-        n = np.random.poisson(lam=lam)
+        n = rng.poisson(lam=lam)
         if n:
             return n
 
@@ -24,513 +45,987 @@ def check_probability(x:np.array) -> bool:
     return np.round(np.sum(x), OUTPUT_ROUNDING) == 1.0
 
 
-def generate_files(n_files:int, prefix:str, groups:dict) -> dict:
+def generate_files(rng:np.random.Generator, n_files:int, groups:dict) -> Tuple[
+    Annotated[np.ndarray, "group_indptr"],
+    Annotated[np.ndarray, "group_files"],
+    Annotated[np.ndarray, "group_p"],
+    Annotated[np.ndarray, "ungrouped"]
+]:
     """
-    Generates a list of files on arbitrary lenght and assign a given numer of them
+    Generates the ids of n_files files and assign a given numer of them to file
+    groups. Groups are filled in order from a single random permutation of the
+    files until the files run out, the remaining files are Ungrouped.
     """
+    assert n_files > 0, "at least one file is needed."
 
-    c = n_files
-    filelist = []
-    
-    while c > 0:
-        c -= 1
-        filelist.append(f"{prefix}_{c}")
-        
+    filelist = rng.permutation(n_files)
 
-    assert len(filelist), "at least one file is needed."
-
-    filegroups = {}
-    
-    for i in range(groups["number"]):
-        if groups["random"]:
-            n = get_random_num(lam=groups["lenght"])
-            p = np.random.normal(loc=groups["p"], scale=0.01)
-        else:
-            n = groups["lenght"]
-            p = groups["p"]
-
-        group_files = []
-        for j in range(n):
-            idx = filelist.index(np.random.choice(filelist))
-            group_files.append(filelist.pop(idx))
-            if not len(filelist):
-                break
-    
-        filegroups.update({f"FileGroup{i}":{"FileNames":group_files, "p":p}})
-        if not len(filelist):
-            break
+    n_groups = groups["number"]
+    if groups["random"]:
+        sizes = sample_positive_poisson(rng, groups["lenght"], n_groups)
+        ps = rng.normal(loc=groups["p"], scale=0.01, size=n_groups)
+    else:
+        sizes = np.full(n_groups, groups["lenght"], dtype=np.int64)
+        ps = np.full(n_groups, groups["p"], dtype=float)
 
-    filegroups.update({"Ungrouped":{"FileNames":filelist, "p":.0}})
+    ends = np.minimum(np.cumsum(sizes), n_files)
+    starts = np.concatenate([[0], ends[:-1]]).astype(np.int64)
+    # a group is created only if files are left when it is reached
+    n_groups = int(np.count_nonzero(starts < n_files))
+    group_indptr = np.concatenate([starts[:n_groups], ends[n_groups - 1:n_groups]]).astype(np.int64)
+    grouped = int(group_indptr[-1]) if n_groups else 0
 
-    return filegroups
+    return group_indptr, filelist[:grouped], ps[:n_groups], filelist[grouped:]
 
 
-def generate_modules(n_mods:int, prefix:str, lam:float, rand:bool) -> list:
+def generate_modules(rng:np.random.Generator, n_mods:int, lam:float, rand:bool) -> Annotated[np.ndarray, "lambdas"]:
     """
-    Generates a list of modules of arbitrary lenght. If rand=True randomly generate
+    Generates the number of files of n_mods modules. If rand=True randomly generate
     a value of lambda, else use the given one.
     """
-    modules = []
-    for i in range(n_mods):
-        if rand:
-            n = get_random_num(lam=lam)
-        else:
-            n = n_mods
-        modules.append({"id":f"{prefix}_{i}", "lambda":n})
-        
-    return modules
+    if rand:
+        return sample_positive_poisson(rng, lam, n_mods)
+    return np.full(n_mods, n_mods, dtype=np.int64)
 
 
-def generate_authors(n_authors:int, prefix:str, contribution:str) -> list:
+def generate_authors(rng:np.random.Generator, n_authors:int, contribution:str) -> Annotated[np.ndarray, "p"]:
     """
-    Generates a list of authors of arbitrary lenght.
+    Generates the contribution weight of each author.
     """
-    authors = []
     if contribution == "equal":
-        p = [1 / n_authors] * n_authors
+        p = np.full(n_authors, 1 / n_authors)
     elif contribution == "random":
-        p = list(np.random.dirichlet([1.] * n_authors, 1).reshape(-1,))
+        p = rng.dirichlet([1.] * n_authors, 1).reshape(-1,)
     
     assert check_probability(p) == 1.0
 
-    for i in range(n_authors):
-        authors.append({"name":f"{prefix}_{i}", "p":p[i]})
-        
-    return authors
+    return p
 
 
-def parse_config(path_to_config:str) -> Tuple[
+def read_config(path_to_config:"str | dict") -> dict:
+    """
+    returns the content of a configuration file, or the given dict.
+    """
+    if isinstance(path_to_config, dict):
+        return path_to_config
+    with open(path_to_config, "r") as f:
+        return yaml.safe_load(f)
+
+
+def parse_config(
+    path_to_config:"str | dict", streams:RandomStreams, cache:Optional[StageCache]=None, metrics:Optional[Metrics]=None
+) -> Tuple[
     Annotated[dict, "config"], 
-    Annotated[dict, "files"],
-    Annotated[list, "modules"],
-    Annotated[dict, "authors"],
+    Annotated[IdTable, "ids"],
+    Annotated[np.ndarray, "modules"],
+    Annotated[np.ndarray, "authors"],
 ]:
     """
-    Parses configuration file and returns configuration file content and 
+    Parses configuration file and returns configuration file content, the id table
+    of files, groups, modules, authors and issues, the number of files of each
+    module and the contribution weight of each author. The content of the
+    configuration can also be given as a dict.
     """
-    
-    with open(path_to_config, "r") as f:
-        config = yaml.safe_load(f)
+    cache = cache or StageCache()
+    config = read_config(path_to_config)
+
+    group_indptr, group_files, group_p, ungrouped = cache.fetch(
+        "files",
+        (streams.entropy, section(config, "Files")),
+        lambda: generate_files(
+            streams.generator("files"),
+            config["Files"]["number"],
+            config["Files"]["filegroups"],
+        ),
+        metrics
+    )
 
-    files = generate_files(
-        config["Files"]["number"],
-        config["Files"]["prefix"],
-        config["Files"]["filegroups"],
+    modules = cache.fetch(
+        "modules",
+        (streams.entropy, section(config, "Modules")),
+        lambda: generate_modules(
+            streams.generator("modules"),
+            config["Modules"]["number"],
+            config["Modules"]["lambda"],
+            config["Modules"]["random"]
+        ),
+        metrics
     )
 
-    modules = generate_modules(
-        config["Modules"]["number"],
-        config["Modules"]["prefix"],
-        config["Modules"]["lambda"],
-        config["Modules"]["random"]
+    authors = cache.fetch(
+        "authors",
+        (streams.entropy, section(config, "Authors")),
+        lambda: generate_authors(
+            streams.generator("authors"),
+            config["Authors"]["number"],
+            config["Authors"]["contribution"],
+        ),
+        metrics
     )
 
-    authors = generate_authors(
-        config["Authors"]["number"],
-        config["Authors"]["prefix"],
-        config["Authors"]["contribution"],
+    ids = IdTable(
+        files=NameIndex(config["Files"]["prefix"], config["Files"]["number"]),
+        groups=NameIndex("FileGroup", len(group_p), sep=""),
+        modules=NameIndex(config["Modules"]["prefix"], len(modules)),
+        authors=NameIndex(config["Authors"]["prefix"], len(authors)),
+        issues=NameIndex(config["Issues"]["prefix"], config["Issues"]["number"], sep=""),
     )
+    ids.set_groups(group_indptr, group_files, group_p, ungrouped)
 
-    return config, files, modules, authors
+    return config, ids, modules, authors
 
 
-def generate_file_matrix(files:dict, repo:dict, authors:list) -> Tuple[
-    Annotated[pd.DataFrame, "filematrix"],
-    Annotated[pd.DataFrame, "fileauthors"],
-    Annotated[list, "repo_files"]
-]:
+def group_chunks(sizes:np.ndarray) -> Annotated[np.ndarray, "bounds"]:
     """
-    Generate file dependancies matrix and author transitions for each file
-    """
-    all_files = []
-    _ = [all_files.extend(repo[str(group)]["FileNames"]) for group in repo]
-    n_files = len(all_files)
-    FileMatrix = np.zeros((n_files, n_files), dtype=float)
-    all_authors = [author["name"] for author in authors]
-    authors_sampling_p = [author["p"] for author in authors]
-    authors_by_name = []
-    authors_transition = []
-    m = 0
-    for group in repo:
-        group_files = repo[str(group)]["FileNames"]
-        p = files[str(group)]["p"]
-        n = len(group_files)
-        if group != "Ungrouped":
-            assert p > .0, "p must be > 0"
-            assert p < 1., "p must be < 1"
-            q = 1 - p
-            x = [q/n]*n
-            while True:
-                A = np.random.dirichlet(np.ones(n), n) - x
-                if (A > 0.).all():
-                    FileMatrix[m:m+n, m:m+n] = A
-                    m += n
-                    authors_by_name.extend([str(np.random.choice(all_authors, p=authors_sampling_p))]*n)
-                    authors_transition.extend([q]*n)
-                    break
-        else:
-            x = [0.05/n]*n
-            A = np.random.dirichlet(np.ones(n), n) - x
-            A[A < 0] = 0.0
-            FileMatrix[m:m+n, m:m+n] = A
-            m += n
-            authors_by_name.extend([str(np.random.choice(all_authors, p=authors_sampling_p)) for _ in range(n)])
-            _ = [authors_transition.extend([1 - A[i].sum()]) for i in range(n)]
-
-
-    assert len(authors_by_name) == n_files
-    assert m == n_files
-
-    for i in range(n_files):              # generate the 
-        assert np.round(FileMatrix[i,:].sum() + authors_transition[i], OUTPUT_ROUNDING) == 1 # the sum of all the transition probabilities must sum up to 1
-    
-    filematrix = pd.DataFrame(FileMatrix, columns=all_files, index=all_files)
-    fileauthors = pd.DataFrame(
-        {
-            "AuthorName": authors_by_name,
-            "AuthorProb": authors_transition
-        },
-        index=all_files
-    )
+    returns the bounds of the chunks of consecutive FileGroups of the given sizes
+    holding about GROUP_CHUNK transitions: chunk c holds the groups from bounds[c]
+    to bounds[c + 1]. A group larger than GROUP_CHUNK makes a chunk on its own.
+    """
+    if not len(sizes):
+        return np.zeros(1, dtype=np.int64)
+    entries = sizes ** 2
+    chunk = (np.cumsum(entries) - entries) // GROUP_CHUNK
+    return np.append(np.flatnonzero(np.append(True, chunk[1:] != chunk[:-1])), len(sizes))
 
-    return filematrix, fileauthors, all_files
 
+def group_files(ids:IdTable, groups:np.ndarray) -> np.ndarray:
+    """
+    returns the files of the given FileGroups, group by group.
+    """
+    starts = ids.group_indptr[groups]
+    sizes = ids.group_size(groups)
+    return ids.group_files[np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(sizes.sum())]
+
+
+def sample_group_chunk(rng:np.random.Generator, sizes:np.ndarray, p:np.ndarray) -> Tuple[
+    Annotated[np.ndarray, "indptr"],
+    Annotated[np.ndarray, "indices"],
+    Annotated[np.ndarray, "data"]
+]:
+    """
+    Samples the diagonal blocks of consecutive FileGroups and returns them in CSR
+    form over the files of the groups. The blocks of the groups of the same size
+    are sampled at once.
+    """
+    entries = sizes ** 2
+    offsets = np.cumsum(sizes) - sizes
+    starts = np.cumsum(entries) - entries
+    indices = np.empty(entries.sum(), dtype=np.int64)
+    data = np.empty(entries.sum(), dtype=float)
+    for n in np.unique(sizes).tolist():
+        groups = np.flatnonzero(sizes == n)
+        positions = starts[groups, None] + np.arange(n * n)
+        data[positions] = sample_group_blocks(rng, n, p[groups]).reshape(len(groups), n * n)
+        indices[positions] = offsets[groups, None] + np.tile(np.arange(n), n)
+    indptr = np.zeros(sizes.sum() + 1, dtype=np.int64)
+    np.cumsum(np.repeat(sizes, sizes), out=indptr[1:])
+    return indptr, indices, data
+
+
+def iter_file_matrix(
+    streams:RandomStreams,
+    ids:IdTable,
+    repo:int,
+    authors:np.ndarray,
+    max_bytes:Optional[int]=None
+) -> Iterator[Tuple[
+    Annotated[SparseMatrix, "filematrix"],
+    Annotated[FileAuthors, "fileauthors"]
+]]:
+    """
+    Generates the file matrix and author transitions of a repo in batches of
+    consecutive chunks of FileGroups, then the Ungrouped block, holding about
+    max_bytes at most, all of them in a single batch if max_bytes is None. A chunk
+    larger than max_bytes makes a batch on its own.
+
+    Every chunk draws from its own stream, so the batches stacked on the diagonal
+    are the matrix generate_file_matrix returns. The authors of every group and of
+    every ungrouped file are drawn at once from the stream of the repo.
+    """
+    groups = ids.repo_group_ids(repo)
+    sizes = ids.group_size(groups)
+    p = ids.group_p[groups].astype(float)
+    assert bool((p > .0).all()), "p must be > 0"
+    assert bool((p < 1.).all()), "p must be < 1"
+    ungrouped = ids.repo_ungrouped_files(repo)
+    drawn = streams.generator("filematrix", repo).choice(len(ids.authors), size=len(groups) + len(ungrouped), p=authors)
+    bounds = group_chunks(sizes)
+
+    def chunks():
+        for c in range(len(bounds) - 1):
+            a, b = bounds[c], bounds[c + 1]
+            files = group_files(ids, groups[a:b])
+            indptr, indices, data = sample_group_chunk(streams.generator("filematrix", repo, c), sizes[a:b], p[a:b])
+            yield (
+                SparseMatrix(indptr, indices, data, files, files),
+                FileAuthors(files, np.repeat(drawn[a:b], sizes[a:b]), np.repeat(1 - p[a:b], sizes[a:b]))
+            )
+        A = sample_ungrouped_block(streams.generator("filematrix", repo, len(bounds) - 1), len(ungrouped))
+        yield SparseMatrix.from_dense(A, ungrouped, ungrouped), FileAuthors(ungrouped, drawn[len(groups):], 1 - A.sum(axis=1))
+
+    def batch(parts):
+        matrices, tables = zip(*parts)
+        return SparseMatrix.block_diag(list(matrices)), FileAuthors.concat(list(tables))
+
+    parts, size = [], 0
+    for filematrix, fileauthors in chunks():
+        chunk_bytes = FILE_ENTRY_BYTES * filematrix.nnz + FILE_BYTES * len(fileauthors)
+        if max_bytes is not None and parts and size + chunk_bytes > max_bytes:
+            yield batch(parts)
+            parts, size = [], 0
+        parts.append((filematrix, fileauthors))
+        size += chunk_bytes
+    yield batch(parts)
+
+
+def generate_file_matrix(streams:RandomStreams, ids:IdTable, repo:int, authors:np.ndarray) -> Tuple[
+    Annotated[SparseMatrix, "filematrix"],
+    Annotated[FileAuthors, "fileauthors"],
+    Annotated[np.ndarray, "repo_files"]
+]:
+    """
+    Generate file dependancies matrix and author transitions for each file. The
+    matrix is block diagonal (one block per FileGroup plus the Ungrouped block) and
+    only its non-zero transitions are stored.
+    """
+    (filematrix, fileauthors), = iter_file_matrix(streams, ids, repo, authors)
+    assert len(fileauthors) == len(ids.repo_files(repo))
+    return filematrix, fileauthors, filematrix.index
 
-def select_module_files(modules:dict, all_files:list) -> Tuple[Annotated[dict, "modules"]]:
 
+class FileMatrixBatches:
     """
-    Generate modules dependancies matrix.
+    File matrix and author transitions of a repo, generated in batches of about
+    max_bytes when iterated with batches. Every pass regenerates the same batches
+    from the filematrix streams of the repo.
     """
-    all_mods = {}
-    for module in modules:
-        # select a number of files 
-        mod_name = module["id"]
-        module_files = np.random.choice(all_files, size=module["lambda"], replace=True)
+    __slots__ = ("streams", "ids", "repo", "authors", "max_bytes")
 
-        all_mods.update({str(mod_name):module_files})
+    def __init__(self, streams:RandomStreams, ids:IdTable, repo:int, authors:np.ndarray, max_bytes:int):
+        self.streams = streams
+        self.ids = ids
+        self.repo = repo
+        self.authors = authors
+        self.max_bytes = max_bytes
 
-    return all_mods
+    def batches(self) -> Iterator[Tuple[SparseMatrix, FileAuthors]]:
+        return iter_file_matrix(self.streams, self.ids, self.repo, self.authors, self.max_bytes)
 
 
-def generate_module_matrix(all_mods:dict, repo:dict) -> Tuple[
-    Annotated[pd.DataFrame, "modulematrix"],
-    Annotated[list, "modules_list"]
+def select_module_files(rng:np.random.Generator, modules:np.ndarray, all_files:np.ndarray) -> Tuple[
+    Annotated[np.ndarray, "module_indptr"],
+    Annotated[np.ndarray, "module_files"]
 ]:
-    repo_files = []
-    _ = [repo_files.extend(files["FileNames"]) for group, files in repo.items()]
-    
-    ModuleMatrix = {}
-    for module_id, mod_files in all_mods.items():
-        ModuleMatrix.update({str(module_id):{}})
-        repo_mod_files = [f for f in mod_files if f in repo_files]
-        n = len(repo_mod_files)
-        if n:
-            a = np.empty(n)
-            a.fill(1.)
-            A = np.random.dirichlet(a)
-            for file, p in zip(repo_mod_files, A):
-                if not str(file) in ModuleMatrix[str(module_id)]:
-                    ModuleMatrix[str(module_id)].update({str(file):float(p)})
-                else:
-                    ModuleMatrix[str(module_id)].update({str(file):ModuleMatrix[str(module_id)][str(file)] + float(p)})
-    
-    modulematrix = pd.DataFrame(ModuleMatrix).fillna(.0)
+    """
+    Selects with replacement the files of every module, the files of module m are
+    module_files[module_indptr[m]:module_indptr[m + 1]].
+    """
+    module_indptr = np.zeros(len(modules) + 1, dtype=np.int64)
+    np.cumsum(modules, out=module_indptr[1:])
+    module_files = rng.choice(all_files, size=int(module_indptr[-1]), replace=True)
 
-    return modulematrix, list(ModuleMatrix.keys())
+    return module_indptr, module_files
 
 
-def select_issue_modules(issues_config:dict, all_modules:list) -> Tuple[Annotated[dict, "issues"]]:
+def generate_module_matrix(rng:np.random.Generator, ids:IdTable, all_mods:tuple, repo:int) -> Tuple[
+    Annotated[SparseMatrix, "modulematrix"],
+    Annotated[np.ndarray, "modules_list"]
+]:
+    """
+    Generate modules dependancies matrix. Row m holds the probability of each file
+    of the repo being impacted through module m, files picked more than once
+    accumulate their probabilities.
+    """
+    module_indptr, module_files = all_mods
+    n_modules = len(ids.modules)
+    modules = np.repeat(np.arange(n_modules), np.diff(module_indptr))
+    in_repo = ids.file_repo[module_files] == repo
+    modules, files = modules[in_repo], module_files[in_repo]
+    p = sample_simplex_rows(rng, modules, n_modules, "module")
 
-    all_issues = {}
-    for i in range(issues_config["number"]):
-        n = get_random_num(issues_config["n_modules"])
-        issue_id = f"{issues_config["prefix"]}{i}"
-        modules = np.random.choice(list(all_modules.keys()), size=n, replace=False)
-        all_issues.update({str(issue_id):modules})
+    modulematrix = SparseMatrix.from_coo(modules, files, p, np.arange(n_modules), np.arange(len(ids.files)))
 
-    return all_issues
+    return modulematrix, np.arange(n_modules)
 
 
-def generate_issue_matrix(all_issues:dict, repo_modules:list) -> Annotated[pd.DataFrame, "issuematrix"]:
+def generate_issue_matrix(
+    streams:RandomStreams, ids:IdTable, all_issues:IssueChunks, repo:int, repo_modules:np.ndarray
+) -> Annotated[IssueMatrix, "issuematrix"]:
     """
-    Generate issues impact matrix.
+    Returns the issues impact matrix of a repo. Row i holds the probability of each
+    module of the repo being targeted by issue i. Rows are generated in chunks each
+    time the matrix is iterated, call to_matrix to keep them.
     """
-    IssueMatix = {}
-    for issue_id, issue_mods in all_issues.items():
-        IssueMatix.update({str(issue_id):{}})
-        repo_issue_modules = [m for m in issue_mods if m in repo_modules]
-        n = len(repo_issue_modules)
-        if n:
-            a = np.empty(n)
-            a.fill(1.)
-            while True:
-                A = np.random.dirichlet(a)
-                if A.sum() == 1.0:
-                    break
-            IssueMatix.update({str(issue_id):{k:v for k, v in zip(repo_issue_modules, A)}})
-
-    issuematrix = pd.DataFrame(IssueMatix).fillna(.0)   
-
-    return issuematrix
-
-
-def select_groups(groups:list, n:int) -> Tuple[list, list]:
-    m = len(groups)
-    repo_groups = []
-    while n > 0:
-        idx = np.random.choice(range(len(groups)))
-        repo_groups.append(groups.pop(idx))
-        n -= 1
-    assert len(groups) + len(repo_groups) == m
-
-    return groups, repo_groups
-
-
-def select_ungrouped(files:list, n:int) -> Tuple[list, list]:
-    m = len(files)
-    repo_ungrouped = []
-    while n > 0:
-        idx = np.random.choice(range(len(files)))
-        repo_ungrouped.append(files.pop(idx))
-        n -= 1
-    assert len(files) + len(repo_ungrouped) == m
-    
-    return files, repo_ungrouped
+    assert all_issues.n_issues == len(ids.issues) and all_issues.n_modules == len(ids.modules)
+    return IssueMatrix(streams, repo, all_issues, repo_modules)
 
 
-def split_groups(files:dict, n_split:int, n_files:int) -> Annotated[dict, "repos"]:
+def split_groups(rng:np.random.Generator, ids:IdTable, n_split:int) -> Annotated[IdTable, "ids"]:
     """
-    split file groups and files between n_split repos.
+    split file groups and files between n_split repos. The first n_split - 1 repos
+    get a Poisson distributed number of groups and ungrouped files drawn from one
+    shuffle of each, the last repo gets the remaining ones. The assignment is
+    stored in the id table, which is returned.
     """
-    groups = list(files.keys())
-    _ = groups.pop(groups.index("Ungrouped"))
-    m = len(groups)
+    m = len(ids.groups)
     lam = int(m / n_split)
-    ungrouped_files = files["Ungrouped"]["FileNames"]
+    ungrouped_files = ids.ungrouped
     u_lam = int(len(ungrouped_files) / n_split)
-    
-    repos = {}
-
-    assert (
-        (
-            sum([len(files[g]["FileNames"]) for g in groups]) 
-            + len(ungrouped_files)
-        ) == n_files
+    n_files = len(ids.files)
+
+    assert len(ids.group_files) + len(ungrouped_files) == n_files
+
+    group_order = rng.permutation(m)
+    ungrouped_order = ungrouped_files[rng.permutation(len(ungrouped_files))]
+    n = sample_positive_poisson(rng, lam, n_split - 1)
+    u = sample_positive_poisson(rng, u_lam, n_split - 1)
+    # repos drawn after the groups or ungrouped files ran out get none of them
+    repo_group_indptr = np.concatenate([[0], np.minimum(np.cumsum(n), m), [m]]).astype(np.int64)
+    repo_ungrouped_indptr = np.concatenate(
+        [[0], np.minimum(np.cumsum(u), len(ungrouped_files)), [len(ungrouped_files)]]
+    ).astype(np.int64)
+
+    ids.set_repos(
+        NameIndex("Repo", n_split),
+        repo_group_indptr,
+        group_order,
+        repo_ungrouped_indptr,
+        ungrouped_order,
     )
 
-    file_n = 0
+    file_n = int(ids.group_size(group_order).sum()) + len(ungrouped_order)
+    assert len(ids.repos) == n_split
+    assert file_n == n_files, "missing files in repos configuration."
+    assert np.bincount(ids.file_repo, minlength=n_split).sum() == n_files
 
-    for i in range(n_split - 1):
-        n = get_random_num(lam=lam)
-        groups, repo_groups = select_groups(groups, n)
-        
-        assert len(groups) + n == m
+    return ids
+    
 
-        repo_files = {}
-        for group in repo_groups:
-            repo_files.update({group:files[group]})
-        u = get_random_num(lam=u_lam)
-        ungrouped_files, repo_ungrouped = select_ungrouped(ungrouped_files, u)
-        repo_files.update({"Ungrouped":{"FileNames":repo_ungrouped, "p":0.0}})
+def prepare_data(
+    path_to_config:"str | dict",
+    n_split:int,
+    streams:RandomStreams,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None
+) -> Tuple[
+    Annotated[dict, "config"],
+    Annotated[IdTable, "ids"],
+    Annotated[np.ndarray, "authors"],
+    Annotated[tuple, "modules"],
+    Annotated[IssueChunks, "issues"]
+]:
+    """
+    Runs the stages shared by all the repos: file groups, modules and authors
+    generation, the repo split and the module and issue selections. Their outputs
+    are reused from cache when the inputs they read did not change, except for the
+    issues which are generated lazily in chunks.
+    """
+    metrics = metrics or Metrics()
+    cache = cache or StageCache()
+    with metrics.stage("parse_config"):
+        config, ids, modules, authors = parse_config(path_to_config, streams, cache, metrics)
+
+    def split():
+        split_groups(streams.generator("split"), ids, n_split)
+        return ids.repo_group_indptr, ids.repo_groups, ids.repo_ungrouped_indptr, ids.repo_ungrouped
+
+    with metrics.stage("split_groups"):
+        repos = cache.fetch("split", (streams.entropy, n_split, ids.group_indptr, ids.ungrouped), split, metrics)
+        if ids.repos is None:
+            ids.set_repos(NameIndex("Repo", n_split), *repos)
+    with metrics.stage("select_module_files"):
+        all_files = np.concatenate([ids.repo_files(r) for r in range(len(ids.repos))])
+        all_modules = cache.fetch(
+            "module_files",
+            (streams.entropy, modules, all_files),
+            lambda: select_module_files(streams.generator("module_files"), modules, all_files),
+            metrics
+        )
+    # issue modules are selected chunk by chunk from their own streams when the
+    # issues are generated, so they are timed by the stages that read them
+    all_issues = IssueChunks(streams, len(ids.issues), len(ids.modules), config["Issues"]["n_modules"])
+    metrics.count(
+        files=len(ids.files),
+        groups=len(ids.groups),
+        ungrouped_files=len(ids.ungrouped),
+        modules=len(ids.modules),
+        authors=len(ids.authors),
+        issues=len(ids.issues),
+        repos=len(ids.repos),
+    )
 
-        repos.update({f"Repo_{i}":repo_files})
-        m -= n
-        file_n += sum([len(repo_files[g]["FileNames"]) for g in repo_groups]) + len(repo_files["Ungrouped"]["FileNames"])
-    
-    assert len(groups) == m
-    repo_files = {}
-    for group in groups:
-        repo_files.update({group:files[group]})
-    repo_files.update({"Ungrouped":{"FileNames":ungrouped_files, "p":0.0}})
-    repos.update({f"Repo_{n_split - 1}":repo_files})
+    return config, ids, authors, all_modules, all_issues
+
+
+def generate_repo_data(
+    data:tuple,
+    i:int,
+    streams:RandomStreams,
+    artifacts:ArtifactStore,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None,
+    memory_budget:Optional[int]=None
+) -> Tuple[
+    Annotated["SparseMatrix | FileMatrixBatches", "filematrix"],
+    Annotated[Optional[FileAuthors], "fileauthors"],
+    Annotated[SparseMatrix, "modulematrix"],
+    Annotated[IssueMatrix, "issuematrix"]
+]:
+    """
+    Generates the transition matrices of the i-th repo, drawing from the streams
+    of that repo only, and saves them as artifacts. Matrices are reused from cache
+    when the files or modules of the repo did not change, the issue matrix is
+    returned unevaluated. With a memory_budget (in bytes) the file matrix is not
+    built either: a FileMatrixBatches is returned in its place, with no
+    fileauthors, and the file artifacts are saved batch by batch.
+    """
+    config, ids, authors, all_modules, all_issues = data
+    repo_id = ids.repos.name(i)
+    metrics = metrics or Metrics()
+    cache = cache or StageCache()
+    if memory_budget is not None:
+        # the file matrix is generated batch by batch while it is saved and written
+        filematrix, fileauthors = FileMatrixBatches(streams, ids, i, authors, memory_budget), None
+        with metrics.stage("save_artifacts"):
+            artifacts.save_file_batches(repo_id, filematrix.batches(), ids.files, ids.authors)
+    else:
+        # generate filematrix and fileauthors
+        with metrics.stage("generate_file_matrix"):
+            groups = ids.repo_group_ids(i)
+            filematrix, fileauthors, _ = cache.fetch(
+                "filematrix",
+                (streams.entropy, i, ids.repo_files(i), ids.group_size(groups), ids.group_p[groups], authors),
+                lambda: generate_file_matrix(streams, ids, i, authors),
+                metrics
+            )
+        with metrics.stage("save_artifacts"):
+            artifacts.save_matrix("filematrix", repo_id, filematrix, ids.files, ids.files)
+            artifacts.save_fileauthors(repo_id, fileauthors, ids.files, ids.authors)
+        metrics.count(
+            files=filematrix.shape[0],
+            file_edges=filematrix.nnz,
+            authors=len(np.unique(fileauthors.authors)),
+        )
+    # generate modulematrix
+    with metrics.stage("generate_module_matrix"):
+        modulematrix, repo_modules = cache.fetch(
+            "modulematrix",
+            (streams.entropy, i, *all_modules, ids.file_repo == i),
+            lambda: generate_module_matrix(streams.generator("modulematrix", i), ids, all_modules, i),
+            metrics
+        )
+    with metrics.stage("save_artifacts"):
+        artifacts.save_matrix("modulematrix", repo_id, modulematrix, ids.modules, ids.files, "module", "file")
+    # generate issuematrix:
+    with metrics.stage("generate_issue_matrix"):
+        issuematrix = generate_issue_matrix(streams, ids, all_issues, i, repo_modules)
+    with metrics.stage("save_artifacts"):
+        artifacts.save_matrix_chunks(
+            "issuematrix", repo_id, issuematrix.row_chunks(), ids.issues, ids.modules, "issue", "module"
+        )
+    metrics.count(
+        modules=int((np.diff(modulematrix.indptr) > 0).sum()),
+        module_edges=modulematrix.nnz,
+    )
 
-    file_n += sum([len(repo_files[g]["FileNames"]) for g in groups]) + len(repo_files["Ungrouped"]["FileNames"])
+    return filematrix, fileauthors, modulematrix, issuematrix
 
-    assert file_n == n_files, "missing files in repos configuration."
 
-    return repos
-    
+def usable_cache(cache:Optional[StageCache], seed:Optional[int]) -> StageCache:
+    """
+    returns cache, or a disabled cache if no seed was given: the streams of an
+    unseeded run are never drawn again, so its entries could not be reused.
+    """
+    if cache is None or not cache.enabled:
+        return StageCache()
+    if seed is None:
+        logging.warning("Stage cache disabled: a seed is needed to reuse stage outputs.")
+        return StageCache()
+    return cache
+
+
+# state shared with the repo tasks, set once per worker process by init_repo_worker
+_repo_worker = {}
+
+
+def init_repo_worker(
+    data:tuple,
+    streams:RandomStreams,
+    artifacts:ArtifactStore,
+    path_to_output:Optional[Path],
+    cache:Optional[StageCache]=None,
+    memory_budget:Optional[int]=None,
+    validation:str="full",
+    write_queue:int=WRITE_QUEUE
+):
+    _repo_worker.update({
+        "data":data, "streams":streams, "artifacts":artifacts, "path_to_output":path_to_output, "cache":cache,
+        "memory_budget":memory_budget, "validation":validation, "write_queue":write_queue, "background":None
+    })
+
+
+def run_repo_task(i:int) -> Tuple[
+    Annotated[Optional[tuple], "matrices"],
+    Annotated[Metrics, "metrics"],
+    Annotated[Validator, "validator"]
+]:
+    """
+    Generates the matrices of the i-th repo and, if an output path was given,
+    writes its markov configuration file instead of returning them. The metrics
+    and the validation results of the repo are returned in both cases.
 
-def generate_data(path_to_config:str, n_split:int, seed:Optional[int]=None) -> Tuple[
+    Files are written on a background thread with a queue of write_queue blocks,
+    shared by the tasks of the worker if map_repos started one, otherwise started
+    for the task and waited for before it returns. 0 writes them synchronously.
+    """
+    data, streams = _repo_worker["data"], _repo_worker["streams"]
+    metrics = Metrics()
+    validator = Validator(_repo_worker["validation"], seed=i)
+    reset_retries()
+    background, own = _repo_worker["background"], None
+    if background is None and _repo_worker["write_queue"] > 0:
+        background = own = BackgroundWriter(_repo_worker["write_queue"])
+    try:
+        matrices = generate_repo_task(i, data, streams, background, metrics, validator)
+    finally:
+        if own is not None:
+            with metrics.stage("write_wait"):
+                own.join()
+    metrics.count(retries=get_retries(), peak_rss_bytes=peak_rss())
+    return matrices, metrics, validator
+
+
+def generate_repo_task(
+    i:int,
+    data:tuple,
+    streams:RandomStreams,
+    background:Optional[BackgroundWriter],
+    metrics:Metrics,
+    validator:Validator
+) -> Optional[tuple]:
+    """
+    body of run_repo_task, writing its files with background.
+    """
+    matrices = generate_repo_data(
+        data, i, streams, _repo_worker["artifacts"].using(background), metrics, _repo_worker["cache"],
+        _repo_worker["memory_budget"]
+    )
+    if _repo_worker["path_to_output"] is not None:
+        with metrics.stage("write_markov"):
+            output_bytes = write_repo_markov(
+                streams,
+                data[1],
+                i,
+                data[0],
+                *matrices,
+                _repo_worker["path_to_output"],
+                metrics,
+                validator,
+                background
+            )
+        metrics.count(output_bytes=output_bytes)
+        matrices = None
+    else:
+        with metrics.stage("generate_issue_matrix"):
+            issuematrix = matrices[-1].to_matrix()
+        metrics.count(issues=int((np.diff(issuematrix.indptr) > 0).sum()), issue_edges=issuematrix.nnz)
+        matrices = (*matrices[:-1], issuematrix)
+        with metrics.stage("validate"):
+            ids, repo_id = data[1], data[1].repos.name(i)
+            validator.check_files(repo_id, ids, i, *matrices[:2])
+            validator.check_modules(repo_id, ids, i, matrices[2])
+            validator.check_issues(repo_id, ids, issuematrix)
+    return matrices
+
+
+def map_repos(
+    data:tuple,
+    streams:RandomStreams,
+    artifacts:ArtifactStore,
+    path_to_output:Optional[Path],
+    workers:int,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None,
+    memory_budget:Optional[int]=None,
+    validator:Optional[Validator]=None,
+    write_queue:int=WRITE_QUEUE
+) -> list:
+    """
+    Runs run_repo_task for every repo, in a pool of worker processes if workers > 1,
+    and returns the results of the tasks. Every repo has its own random streams, so
+    the results do not depend on workers. Repo metrics are merged into metrics and
+    repo validation results into validator, whose level is used by every repo.
+    Without a pool the repos share one background writer, so a repo is generated
+    while the files of the previous one are written; every file is written when
+    map_repos returns.
+    """
+    repos = data[1].repos
+    metrics = metrics or Metrics()
+    validator = validator or Validator()
+    progress = Progress("Repos", len(repos))
+    results = []
+
+    def collect(tasks):
+        for i, (matrices, repo_metrics, repo_validator) in enumerate(tasks):
+            metrics.merge_repo(repos.name(i), repo_metrics)
+            validator.merge(repo_validator)
+            results.append(matrices)
+            progress.update()
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_repo_worker,
+            initargs=(data, streams, artifacts, path_to_output, cache, memory_budget, validator.level, write_queue)
+        ) as pool:
+            collect(pool.map(run_repo_task, range(len(repos))))
+        return results
+
+    init_repo_worker(data, streams, artifacts, path_to_output, cache, memory_budget, validator.level, write_queue)
+    background = BackgroundWriter(write_queue) if write_queue > 0 else None
+    _repo_worker["background"] = background
+    try:
+        collect(run_repo_task(i) for i in range(len(repos)))
+    finally:
+        _repo_worker.clear()
+        if background is not None:
+            with metrics.stage("write_wait"):
+                background.join()
+    return results
+
+
+def generate_data(
+    path_to_config:"str | dict",
+    n_split:int,
+    seed:Optional[int]=None,
+    workers:int=1,
+    artifacts:Optional[ArtifactStore]=None,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None,
+    validator:Optional[Validator]=None
+) -> Tuple[
     Annotated[dict, "config"],
-    Annotated[dict, "repos"],
-    Annotated[pd.DataFrame, "filematrix"],
-    Annotated[pd.DataFrame, "fileauthors"],
-    Annotated[pd.DataFrame, "modulematrix"],
-    Annotated[pd.DataFrame, "issuematrix"]
+    Annotated[IdTable, "ids"],
+    Annotated[list, "filematrix"],
+    Annotated[list, "fileauthors"],
+    Annotated[list, "modulematrix"],
+    Annotated[list, "issuematrix"]
 ]:
     """
     Generates the transition matrices needed to constract the markov config file.
+    Matrices are labelled with the integer ids of the returned id table and saved
+    to artifacts (csv files in ./tmp by default). They are checked at the level of
+    validator (every row by default) and the violations of all the repos are
+    raised at the end.
     """
-    repos_list = []
-    filematrix_list = []
-    fileauthors_list = []
-    modulematrix_list = []
-    issuematrix_list = []
-    all_files = []
+    artifacts = artifacts or ArtifactStore()
+    metrics = metrics or Metrics()
+    validator = validator or Validator()
+    artifacts.prepare()
+    streams = RandomStreams(seed)
+    cache = usable_cache(cache, seed)
+    data = prepare_data(path_to_config, n_split, streams, metrics, cache)
+    ids = data[1]
+    results = map_repos(data, streams, artifacts, None, workers, metrics, cache, validator=validator)
+    with metrics.stage("concat_artifacts"):
+        artifacts.concat(ids.repos.names())
+    validator.raise_on_violations()
+
+    return data[0], ids, *[list(matrices) for matrices in zip(*results)]
+
+
+def positions(labels:np.ndarray, size:int) -> np.ndarray:
+    """
+    returns the position of every id in labels, -1 for the ids not in labels.
+    """
+    lookup = np.full(size, -1, dtype=np.int64)
+    lookup[labels] = np.arange(len(labels))
+    return lookup
 
-    if seed is not None:
-        np.random.seed(seed)
-    
-    config, files, modules, authors = parse_config(path_to_config)
-    repos = split_groups(files, n_split, config["Files"]["number"]) 
-    # generate filematrix and fileauthors
-    for repo_id, repo in repos.items():
-        filematrix, fileauthors, repo_files = generate_file_matrix(files, repo, authors)
-        filematrix.to_csv(f"./tmp/filematrix_{repo_id}.csv")
-        fileauthors.to_csv(f"./tmp/fileauthors_{repo_id}.csv")
-        filematrix_list.append(filematrix)
-        fileauthors_list.append(fileauthors)
-        all_files.extend(repo_files)
-    pd.concat(filematrix_list, axis=1, ignore_index=False).fillna(0.0).to_csv("./tmp/filematrix.csv")
-    pd.concat(fileauthors_list, axis=0, ignore_index=False).to_csv("./tmp/fileauthors.csv")
-    
-    all_modules = select_module_files(modules, all_files)
-    all_issues = select_issue_modules(config["Issues"], all_modules)
-    # generate modulematrix and issuematrix
-    for repo_id, repo in repos.items():
-        repos_list.append(repo_id)
-        # generate modulematrix
-        modulematrix, repo_modules = generate_module_matrix(all_modules, repo)
-        modulematrix.to_csv(f"./tmp/modulematrix_{repo_id}.csv")
-        modulematrix_list.append(modulematrix)
-        # generate issuematrix:
-        issuematrix = generate_issue_matrix(all_issues, repo_modules)
-        issuematrix.to_csv(f"./tmp/issuematrix_{repo_id}.csv")
-        issuematrix_list.append(issuematrix)
-
-    return config, repos_list, filematrix_list, fileauthors_list, modulematrix_list, issuematrix_list
+
+def first_appearance(ids:np.ndarray) -> np.ndarray:
+    """
+    returns the distinct ids in order of first appearance.
+    """
+    unique, first = np.unique(ids, return_index=True)
+    return unique[np.argsort(first)]
+
+
+def build_file_transitions(
+    ids:IdTable,
+    filematrix:SparseMatrix,
+    fileauthors:FileAuthors
+) -> Annotated[TransitionStore, "transitions"]:
+    """
+    Builds the transitions of a batch of files of a repo, each file row followed
+    by the transition to the file author.
+    """
+    authors = np.unique(fileauthors.authors)
+    author_node = positions(authors, len(ids.authors))
+
+    builder = TransitionStoreBuilder()
+    file0 = builder.add_block(File, ids.files, filematrix.columns)
+    author0 = builder.add_block(Author, ids.authors, authors)
+
+    n_files = len(filematrix.index)
+    indptr = filematrix.indptr + np.arange(n_files + 1)
+    to_author = np.zeros(indptr[-1], dtype=bool)
+    to_author[indptr[1:] - 1] = True
+    targets = np.empty(indptr[-1], dtype=np.int64)
+    targets[~to_author] = file0 + filematrix.indices
+    targets[to_author] = author0 + author_node[fileauthors.authors]
+    p = np.empty(indptr[-1], dtype=float)
+    p[~to_author] = filematrix.data
+    p[to_author] = fileauthors.p
+    builder.add_rows(file0 + np.arange(n_files), indptr, targets, p)
+
+    return builder.build()
+
+
+def build_module_transitions(
+    ids:IdTable,
+    modulematrix:SparseMatrix,
+    authors:np.ndarray
+) -> Annotated[TransitionStore, "transitions"]:
+    """
+    Builds the transitions written after the files of a repo: modules to files and
+    authors, in the given order, to Commit.
+    """
+    modules_rows = np.flatnonzero(np.diff(modulematrix.indptr))
+    module_files = modulematrix.columns[modulematrix.indices]
+    files = np.unique(module_files)
+
+    builder = TransitionStoreBuilder()
+    module0 = builder.add_block(Module, ids.modules, modulematrix.index[modules_rows])
+    file0 = builder.add_block(File, ids.files, files)
+    author0 = builder.add_block(Author, ids.authors, authors)
+    commit = builder.add_block(Commit)
+
+    # modules, the rows left out are empty so the kept rows keep their entries
+    builder.add_rows(
+        module0 + np.arange(len(modules_rows)),
+        np.append(0, modulematrix.indptr[modules_rows + 1]),
+        file0 + np.searchsorted(files, module_files),
+        modulematrix.data
+    )
+    # authors
+    builder.add_rows(
+        author0 + np.arange(len(authors)),
+        np.arange(len(authors) + 1),
+        np.full(len(authors), commit),
+        np.ones(len(authors))
+    )
+
+    return builder.build()
+
+
+def build_issue_transitions(
+    ids:IdTable,
+    issuematrix:SparseMatrix,
+    initial:np.ndarray
+) -> Annotated[TransitionStore, "transitions"]:
+    """
+    Builds the transitions written first in a repo: Initial to the issues with
+    probabilities initial, then the issues (the non-empty rows of issuematrix) to
+    their modules.
+    """
+    issues_rows = np.flatnonzero(np.diff(issuematrix.indptr))
+    assert len(initial) == len(issues_rows), "one Initial transition is needed for every issue."
+
+    builder = TransitionStoreBuilder()
+    start = builder.add_block(Initial)
+    issue0 = builder.add_block(Issue, ids.issues, issuematrix.index[issues_rows])
+    module0 = builder.add_block(Module, ids.modules, issuematrix.columns)
+
+    builder.add_rows(np.array([start]), np.array([0, len(issues_rows)]), issue0 + np.arange(len(issues_rows)), initial)
+    # issues, the rows left out are empty so the kept rows keep their entries
+    builder.add_rows(
+        issue0 + np.arange(len(issues_rows)),
+        np.append(0, issuematrix.indptr[issues_rows + 1]),
+        module0 + issuematrix.indices,
+        issuematrix.data
+    )
+
+    return builder.build()
+
+
+def issue_chunk_draws(streams:RandomStreams, repo:int, c:int, n:int, lam:float) -> Tuple[
+    Annotated[np.ndarray, "average_consecutive_commits"],
+    Annotated[np.ndarray, "weights"]
+]:
+    """
+    returns the average consecutive commits of the n issues of the c-th chunk of a
+    repo and their unnormalized weights in the Initial node, drawn from the stream
+    of the chunk so that every pass draws the same values.
+    """
+    rng = streams.generator("markov", repo, c)
+    return sample_positive_poisson(rng, lam, n).astype(float), rng.standard_exponential(n)
+
+
+def write_repo_issues(
+    writer:MarkovWriter,
+    streams:RandomStreams,
+    ids:IdTable,
+    repo:int,
+    config:dict,
+    issuematrix:IssueMatrix,
+    metrics:Optional[Metrics]=None,
+    validator:Optional[Validator]=None
+):
+    """
+    Streams the issue sequence, the Initial node and the issue nodes of a repo.
+    The issue matrix is iterated once for each of them, so a single chunk of issues
+    is in memory at a time. The Initial transitions are Dirichlet(1, ..., 1) drawn
+    as exponentials normalized by their sum, which is taken in the first pass.
+    """
+    metrics = metrics or Metrics()
+    validator = validator or Validator()
+    repo_id = ids.repos.name(repo)
+    lam = config["Issues"]["lambda"]
+    module_tags = np.array(tagged(Module, ids.modules.names()), dtype=object)
+
+    def chunks():
+        for c, chunk in enumerate(issuematrix.row_chunks(ISSUE_CHUNK)):
+            rows = np.flatnonzero(np.diff(chunk.indptr))
+            yield c, chunk, rows, tagged(Issue, ids.issues.names(chunk.index[rows]))
+
+    total = 0.
+    writer.begin_issue_sequence()
+    for c, chunk, rows, issues_tags in chunks():
+        validator.check_issues(repo_id, ids, chunk)
+        average_consecutive_commits, weights = issue_chunk_draws(streams, repo, c, len(rows), lam)
+        writer.issue_sequence_entries(issues_tags, average_consecutive_commits.tolist())
+        total += weights.sum()
+    writer.end_issue_sequence()
+
+    writer.transitions()
+    writer.begin_node(str(Initial(" ")))
+    initial = 0.
+    for c, chunk, rows, issues_tags in chunks():
+        _, weights = issue_chunk_draws(streams, repo, c, len(rows), lam)
+        writer.node_transitions(issues_tags, (weights / total).tolist())
+        initial += (weights / total).sum()
+    writer.end_node()
+    if total:
+        validator.check_initial(repo_id, initial)
+
+    progress = Progress(f"{repo_id} issues", issuematrix.shape[0])
+    for c, chunk, rows, issues_tags in chunks():
+        for issue_tag, i in zip(issues_tags, rows):
+            idx, p = chunk.row(i)
+            writer.node(issue_tag, module_tags[chunk.columns[idx]].tolist(), p.tolist())
+        metrics.increment("issues", len(rows))
+        metrics.increment("issue_edges", chunk.nnz)
+        progress.update(len(chunk.index))
+
+
+def write_repo_markov(
+    streams:RandomStreams,
+    ids:IdTable,
+    repo:int,
+    config:dict,
+    filematrix:"SparseMatrix | FileMatrixBatches",
+    fileauthors:Optional[FileAuthors],
+    modulematrix:SparseMatrix,
+    issuematrix:IssueMatrix,
+    path_to_output:Path,
+    metrics:Optional[Metrics]=None,
+    validator:Optional[Validator]=None,
+    background:Optional[BackgroundWriter]=None
+) -> Annotated[int, "bytes_written"]:
+    """
+    Streams the markov configuration of a repo node by node to markov_<repo-ID>.yaml
+    and returns the size of the file. Entity names are only formatted here. The
+    issue matrix can also be a SparseMatrix, it is read in chunks of rows either way.
+    The file matrix can be a FileMatrixBatches without fileauthors, files are then
+    written one batch at a time and counted in metrics.
+
+    Transitions are checked by validator as they are written, violations are left
+    to the caller. Without a validator every row is checked and violations are
+    raised once the file is written. The file is written by background if given,
+    the caller then waits for it with background.join.
+    """
+    repo_id = ids.repos.name(repo)
+    metrics = metrics or Metrics()
+    raise_on_violations = validator is None
+    validator = validator or Validator()
+    logging.debug(f"Processing repo {repo_id}")
+    validator.check_modules(repo_id, ids, repo, modulematrix)
+    batched = fileauthors is None
+    batches = filematrix.batches() if batched else [(filematrix, fileauthors)]
+
+    path_to_markov = path_to_output / f"markov_{repo_id}.yaml"
+    with open_markov(path_to_markov, background) as f:
+        writer = MarkovWriter(f)
+        write_repo_issues(writer, streams, ids, repo, config, issuematrix, metrics, validator)
+        progress = Progress(f"{repo_id} files", len(ids.repo_files(repo)))
+        authors = np.zeros(0, dtype=np.int64)
+        for batch_matrix, batch_authors in batches:
+            validator.check_files(repo_id, ids, repo, batch_matrix, batch_authors)
+            writer.store(build_file_transitions(ids, batch_matrix, batch_authors), progress)
+            new_authors = first_appearance(batch_authors.authors)
+            authors = np.concatenate([authors, new_authors[~np.isin(new_authors, authors)]])
+            if batched:
+                metrics.increment("files", len(batch_matrix.index))
+                metrics.increment("file_edges", batch_matrix.nnz)
+        if batched:
+            metrics.count(authors=len(authors))
+        store = build_module_transitions(ids, modulematrix, authors)
+        logging.debug(f"{len(store.sources)} module and author nodes in {repo_id}.")
+        writer.store(store)
+
+    logging.debug(f"{repo_id} configuration created.")
+    logging.debug(f"Configuration file saved {path_to_markov}")
+    if raise_on_violations:
+        validator.raise_on_violations()
+    return writer.bytes_written
 
 
 def generate_markov(
-    path_to_config:str, n_split:int, path_to_output:str, seed:Optional[int]=None
-) -> Annotated[dict, "markov_config"]:
+    path_to_config:"str | dict",
+    n_split:int,
+    path_to_output:str,
+    seed:Optional[int]=None,
+    workers:int=1,
+    artifacts:Optional[ArtifactStore]=None,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None,
+    memory_budget:Optional[int]=None,
+    validator:Optional[Validator]=None,
+    write_queue:int=WRITE_QUEUE
+) -> None:
     """
-    Generates the markov config file used to generate synthetic repository.
+    Generates the markov config file used to generate synthetic repository. Repos
+    are processed by `workers` processes, each repo drawing from its own random
+    streams derived from `seed`, so the output does not depend on `workers`.
+    Intermediate matrices are saved to artifacts (csv files in ./tmp by default)
+    and the stage timings and counts are recorded in metrics. Stage outputs are
+    reused from cache across seeded runs. With a memory_budget (in bytes, per
+    worker) the file matrices are generated, saved and written in batches of
+    groups kept under the budget instead of being built whole. Transitions are
+    checked at the level of validator (every row by default) and the violations
+    of all the repos are raised once every file is written. Markov files and csv
+    artifacts are written on a background thread, with at most write_queue blocks
+    waiting, while the next transitions are generated; 0 writes them in line.
     """
+    artifacts = artifacts or ArtifactStore()
+    metrics = metrics or Metrics()
+    validator = validator or Validator()
     logging.info("Generating synthetic repo configuration.")
-    markov = {}
     logging.debug("Parsing configuration.")
     try:
-        (config, repos_list, filematrix_list, fileauthors_list, modulematrix_list, 
-            issuematrix_list) = generate_data(path_to_config, n_split, seed=seed)
+        streams = RandomStreams(seed)
+        cache = usable_cache(cache, seed)
+        data = prepare_data(path_to_config, n_split, streams, metrics, cache)
     except Exception as e:
         logging.error(e)
         raise e
 
     logging.debug("Generating markov configuration files.")
-
-    for repo_id, filematrix, fileauthors, modulematrix, issuematrix in zip(
-        repos_list, 
-        filematrix_list, 
-        fileauthors_list, 
-        modulematrix_list, 
-        issuematrix_list
-    ):
-        logging.info(f"Processing repo {repo_id}")
-        try:
-            assert bool((np.round(filematrix.iloc[:,:].sum(axis=1) + fileauthors.iloc[:,-1], OUTPUT_ROUNDING) == 1).all()), "files transitions do not sum up to 1!"
-            # add files
-            files_ids = filematrix.index.tolist()
-            files = []
-            for file_id in files_ids:
-                file = File(file_id)
-                file_files = filematrix.loc[files_ids, files_ids].index[filematrix.loc[file_id,files_ids] > 0].values.tolist()
-                file_files_p = filematrix.loc[file_id, file_files].tolist()
-
-                for f, p in zip(file_files, file_files_p):
-                    file.to = File(f)
-                    file.p = p
-                author_p = fileauthors.loc[file_id, "AuthorProb"]
-                file.to = Author(fileauthors.loc[file_id, "AuthorName"])
-                file.p = float(author_p)
-                assert np.round(np.sum(file_files_p) + author_p, OUTPUT_ROUNDING) == 1, f"transitions for {str(file)} do not sum to 1"
-
-                files.append(file)
-
-                logging.info(f"Generated {len(files)} files.")
-        except Exception as e:
-            logging.error(e)
-            raise e
-
-        # add authors
-        try:
-            autors_ids = fileauthors.loc[files_ids, "AuthorName"].unique().tolist()
-            authors = []
-            for author_id in autors_ids:
-                author = Author(author_id)
-                author.to = Commit()
-                author.p = 1.
-                authors.append(author)
-            logging.info(f"Connected {len(autors_ids)} authors.")
-        except Exception as e:
-            logging.error(e)
-            raise e
-
-        try:
-            # add modules 
-            modules = []
-            modules_ids = modulematrix.columns.tolist()
-            for module_id in modules_ids:
-                module = Module(module_id)
-                filt_modmat = modulematrix.loc[modulematrix.index.isin(files_ids)]
-                module_files = filt_modmat.index[(filt_modmat.loc[:, module_id] > 0)].values.tolist()
-                if len(module_files):
-                    module_files_p = filt_modmat.loc[module_files, module_id].values.tolist()
-                    assert check_probability(module_files_p) == 1, f"transitions for {str(module)} do not sum to 1"
-
-                    for f, p in zip(module_files, module_files_p):
-                        module.to = File(f)
-                        module.p = p
-                    modules.append(module)
-            logging.info(f"Attached {len(modules)} modules to repo.")
-        except Exception as e:
-            logging.error(e)
-            raise e
-
-        try:
-            # add issue sequence
-            issues = []
-            issues_ids = issuematrix.columns.tolist()    
-            for issue_id in issues_ids:
-                issue = Issue(issue_id)
-                issue_modules = issuematrix.index[issuematrix.loc[:,issue_id] > 0.0].values.tolist()
-                if len(issue_modules):
-                    issue_modules_p = issuematrix.loc[issue_modules, issue_id].values
-                    assert check_probability(issue_modules_p), f"transitions for {str(issue)} do not sum to 1"
-                    
-                    for m, p in zip(issue_modules, issue_modules_p):
-                        issue.to = Module(m)
-                        issue.p = p
-                    issue.average_consecutive_commits = get_random_num(lam=config["Issues"]["lambda"])
-                    issues.append(issue)
-
-            average_consecutive_commits = {str(i):float(i.average_consecutive_commits) for i in issues}
-            issue_sequence = { 
-                "average_consecutive_commits":average_consecutive_commits
-            }
-            logging.info(f"Created {len(issues)} for current repo.")
-        except Exception as e:
-            logging.error(e)
-            raise e
-    
-        a = np.empty(len(issues))
-        a.fill(1.)
-        issues_p = np.random.dirichlet(a)
-        initial = [{"to":str(i), "p":float(p)} for i, p in zip(issues, issues_p)]
-        matrix = {str(Initial(" ")):initial}
-        for issue in issues:
-            matrix.update({str(issue):[{"to":str(to), "p":float(p)} for to, p in zip(issue.to, issue.p)]})
-        for file in files:
-            matrix.update({str(file):[{"to":str(to), "p":float(p)} for to, p in zip(file.to, file.p)]})
-        for module in modules:
-            matrix.update({str(module):[{"to":str(to), "p":float(p)} for to, p in zip(module.to, module.p)]})
-        for author in authors:
-            matrix.update({str(author):[{"to":str(to), "p":float(p)} for to, p in zip(author.to, author.p)]})
-        transitions = {"matrix":matrix}
-        markov = {"issue_sequence":issue_sequence, "transitions":transitions}
-
-        logging.info(f"{repo_id} configuration created.")
-        with open(path_to_output / f"markov_{repo_id}.yaml", 'w') as f:
-            f.write(yaml.dump(markov, sort_keys=False).replace("'", ""))
-        logging.info(f"Configuration file saved {path_to_output / f"markov_{repo_id}.yaml"}")
\ No newline at end of file
+    artifacts.prepare()
+    map_repos(
+        data, streams, artifacts, Path(path_to_output), workers, metrics, cache, memory_budget, validator, write_queue
+    )
+    with metrics.stage("concat_artifacts"):
+        artifacts.concat(data[1].repos.names())
+    validator.raise_on_violations()
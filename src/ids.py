@@ -0,0 +1,133 @@
+import numpy as np
+from typing import Iterable, Optional
+
+# group id of the files that do not belong to any FileGroup
+UNGROUPED = -1
+
+
+class NameIndex:
+    """
+    Interned names of one kind of entity. Entity i is named `<prefix><sep><i>`, so
+    stages only handle the integer ids and names are formatted on output.
+    """
+    __slots__ = ("prefix", "sep", "size", "_lookup")
+
+    def __init__(self, prefix:str, size:int, sep:str="_"):
+        self.prefix = prefix
+        self.sep = sep
+        self.size = int(size)
+        self._lookup = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self) -> tuple:
+        return self.prefix, self.sep, self.size
+
+    def __setstate__(self, state:tuple):
+        self.prefix, self.sep, self.size = state
+        self._lookup = None
+
+    def name(self, i:int) -> str:
+        return f"{self.prefix}{self.sep}{i}"
+
+    def names(self, ids:Optional[Iterable[int]]=None) -> list[str]:
+        """
+        returns the names of the given ids, of every id if ids is None.
+        """
+        if ids is None:
+            ids = range(self.size)
+        elif isinstance(ids, np.ndarray):
+            ids = ids.tolist()
+        head = self.prefix + self.sep
+        return [f"{head}{i}" for i in ids]
+
+    def id(self, name:str) -> int:
+        if self._lookup is None:
+            self._lookup = {n:i for i, n in enumerate(self.names())}
+        return self._lookup[name]
+
+
+class IdTable:
+    """
+    Integer id table shared by every generator stage. It is built once: files,
+    groups, modules, authors and issues by parse_config, the file to repo
+    assignment by split_groups.
+
+    Group and repo memberships are stored in CSR form, e.g. the files of group g
+    are group_files[group_indptr[g]:group_indptr[g + 1]].
+    """
+    __slots__ = (
+        "files", "groups", "modules", "authors", "issues", "repos",
+        "file_group", "group_p", "group_indptr", "group_files", "ungrouped",
+        "file_repo", "repo_group_indptr", "repo_groups", "repo_ungrouped_indptr", "repo_ungrouped",
+    )
+
+    def __init__(self, files:NameIndex, groups:NameIndex, modules:NameIndex, authors:NameIndex, issues:NameIndex):
+        self.files = files
+        self.groups = groups
+        self.modules = modules
+        self.authors = authors
+        self.issues = issues
+        self.repos = None
+        self.file_group = None
+        self.group_p = None
+        self.group_indptr = None
+        self.group_files = None
+        self.ungrouped = None
+        self.file_repo = None
+        self.repo_group_indptr = None
+        self.repo_groups = None
+        self.repo_ungrouped_indptr = None
+        self.repo_ungrouped = None
+
+    def set_groups(self, group_indptr:np.ndarray, group_files:np.ndarray, group_p:np.ndarray, ungrouped:np.ndarray):
+        assert len(group_indptr) == len(self.groups) + 1 == len(group_p) + 1
+        assert len(group_files) + len(ungrouped) == len(self.files), "every file must be grouped or ungrouped."
+        self.group_indptr = group_indptr
+        self.group_files = group_files
+        self.group_p = group_p
+        self.ungrouped = ungrouped
+        self.file_group = np.full(len(self.files), UNGROUPED, dtype=np.int64)
+        self.file_group[group_files] = np.repeat(np.arange(len(self.groups)), np.diff(group_indptr))
+
+    def set_repos(
+        self,
+        repos:NameIndex,
+        repo_group_indptr:np.ndarray,
+        repo_groups:np.ndarray,
+        repo_ungrouped_indptr:np.ndarray,
+        repo_ungrouped:np.ndarray,
+    ):
+        self.repos = repos
+        self.repo_group_indptr = repo_group_indptr
+        self.repo_groups = repo_groups
+        self.repo_ungrouped_indptr = repo_ungrouped_indptr
+        self.repo_ungrouped = repo_ungrouped
+        self.file_repo = np.empty(len(self.files), dtype=np.int64)
+        for r in range(len(repos)):
+            self.file_repo[self.repo_files(r)] = r
+
+    def group_size(self, groups:np.ndarray) -> np.ndarray:
+        return self.group_indptr[groups + 1] - self.group_indptr[groups]
+
+    def repo_group_ids(self, r:int) -> np.ndarray:
+        return self.repo_groups[self.repo_group_indptr[r]:self.repo_group_indptr[r + 1]]
+
+    def repo_ungrouped_files(self, r:int) -> np.ndarray:
+        return self.repo_ungrouped[self.repo_ungrouped_indptr[r]:self.repo_ungrouped_indptr[r + 1]]
+
+    def repo_files(self, r:int) -> np.ndarray:
+        """
+        returns the files of repo r, group by group followed by the ungrouped ones.
+        """
+        groups = self.repo_group_ids(r)
+        if len(groups):
+            starts = self.group_indptr[groups]
+            sizes = self.group_indptr[groups + 1] - starts
+            # positions in group_files of every member of the repo groups
+            offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+            grouped = self.group_files[offsets + np.arange(int(sizes.sum()))]
+        else:
+            grouped = np.zeros(0, dtype=np.int64)
+        return np.concatenate([grouped, self.repo_ungrouped_files(r)])
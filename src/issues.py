@@ -0,0 +1,115 @@
+import numpy as np
+from typing import Annotated, Iterator, Optional, Tuple
+
+from src.rng import RandomStreams
+from src.sparse import SparseMatrix
+from src.sampling import sample_positive_poisson, sample_simplex_rows
+
+# issues are generated in chunks of ISSUE_CHUNK issues, each drawing from its own
+# random stream. Chunks are regenerated on every pass over the issues instead of
+# being kept, so memory does not grow with the number of issues.
+ISSUE_CHUNK = 1 << 16
+
+
+def select_issue_modules(rng:np.random.Generator, n_issues:int, n_modules:int, lam:float) -> Tuple[
+    Annotated[np.ndarray, "issue_indptr"],
+    Annotated[np.ndarray, "issue_modules"]
+]:
+    """
+    Selects without replacement the modules targeted by n_issues issues, the modules
+    of issue i are issue_modules[issue_indptr[i]:issue_indptr[i + 1]]. Every issue
+    targets a Poisson(lam) number != 0 of modules, all drawn at once; the modules
+    repeated within an issue are redrawn until they are distinct.
+    """
+    counts = sample_positive_poisson(rng, lam, n_issues)
+    assert not n_issues or counts.max() <= n_modules, "an issue cannot target more modules than there are."
+    issue_indptr = np.zeros(n_issues + 1, dtype=np.int64)
+    np.cumsum(counts, out=issue_indptr[1:])
+    issues = np.repeat(np.arange(n_issues), counts)
+    issue_modules = rng.integers(n_modules, size=len(issues))
+    while True:
+        order = np.lexsort((issue_modules, issues))
+        repeated = (issues[order][1:] == issues[order][:-1]) & (issue_modules[order][1:] == issue_modules[order][:-1])
+        redraw = order[1:][repeated]
+        if not len(redraw):
+            return issue_indptr, issue_modules
+        issue_modules[redraw] = rng.integers(n_modules, size=len(redraw))
+
+
+def generate_issue_chunk(
+    rng:np.random.Generator,
+    start:int,
+    issue_indptr:np.ndarray,
+    issue_modules:np.ndarray,
+    in_repo:np.ndarray
+) -> Annotated[SparseMatrix, "issuematrix"]:
+    """
+    Generates the rows of the issue matrix of a repo for the issues numbered from
+    start. Row i holds the probability of each module of the repo being targeted
+    by the issue.
+    """
+    n_issues = len(issue_indptr) - 1
+    issues = np.repeat(np.arange(n_issues), np.diff(issue_indptr))
+    keep = in_repo[issue_modules]
+    issues, modules = issues[keep], issue_modules[keep]
+    p = sample_simplex_rows(rng, issues, n_issues, "issue")
+
+    return SparseMatrix.from_coo(issues, modules, p, start + np.arange(n_issues), np.arange(len(in_repo)))
+
+
+class IssueChunks:
+    """
+    Modules selected by every issue, generated chunk by chunk when iterated.
+    """
+    __slots__ = ("streams", "n_issues", "n_modules", "lam")
+
+    def __init__(self, streams:RandomStreams, n_issues:int, n_modules:int, lam:float):
+        self.streams = streams
+        self.n_issues = n_issues
+        self.n_modules = n_modules
+        self.lam = lam
+
+    def __len__(self) -> int:
+        # one (empty) chunk without issues, so every pass yields a chunk
+        return max(1, -(-self.n_issues // ISSUE_CHUNK))
+
+    def chunk(self, c:int) -> Tuple[
+        Annotated[int, "start"],
+        Annotated[np.ndarray, "issue_indptr"],
+        Annotated[np.ndarray, "issue_modules"]
+    ]:
+        start = c * ISSUE_CHUNK
+        n = min(ISSUE_CHUNK, self.n_issues - start)
+        return start, *select_issue_modules(self.streams.generator("issue_modules", c), n, self.n_modules, self.lam)
+
+    def __iter__(self) -> Iterator[tuple]:
+        for c in range(len(self)):
+            yield self.chunk(c)
+
+
+class IssueMatrix:
+    """
+    Issue matrix of a repo, generated ISSUE_CHUNK rows at a time when iterated with
+    row_chunks. Every pass regenerates the same rows from the streams of the repo.
+    """
+    __slots__ = ("streams", "repo", "issues", "in_repo")
+
+    def __init__(self, streams:RandomStreams, repo:int, issues:IssueChunks, repo_modules:np.ndarray):
+        self.streams = streams
+        self.repo = repo
+        self.issues = issues
+        self.in_repo = np.zeros(issues.n_modules, dtype=bool)
+        self.in_repo[repo_modules] = True
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.issues.n_issues, self.issues.n_modules
+
+    def row_chunks(self, size:Optional[int]=None) -> Iterator[SparseMatrix]:
+        assert size in (None, ISSUE_CHUNK), "issue matrices are generated in chunks of ISSUE_CHUNK rows."
+        for c, (start, issue_indptr, issue_modules) in enumerate(self.issues):
+            rng = self.streams.generator("issuematrix", self.repo, c)
+            yield generate_issue_chunk(rng, start, issue_indptr, issue_modules, self.in_repo)
+
+    def to_matrix(self) -> SparseMatrix:
+        return SparseMatrix.vstack(list(self.row_chunks()))
@@ -0,0 +1,120 @@
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss(children:bool=False) -> Optional[int]:
+    """
+    returns the peak resident set size in bytes of this process, or of its
+    terminated child processes (the repo workers) if children is True.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class Metrics:
+    """
+    Wall time of the pipeline stages and counts of what they generated. Repo tasks
+    record into their own instance, which is pickled back from the workers and
+    merged with merge_repo.
+    """
+    __slots__ = ("stages", "counts", "repos")
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.repos = {}
+
+    @contextmanager
+    def stage(self, name:str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name:str, seconds:float, calls:int=1):
+        record = self.stages.setdefault(name, {"calls": 0, "seconds": 0.})
+        record["calls"] += calls
+        record["seconds"] += seconds
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def increment(self, name:str, n:int=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge_repo(self, repo_id:str, repo_metrics:"Metrics"):
+        """
+        adds the stages of a repo task to the totals and keeps its counts by repo.
+        """
+        for name, record in repo_metrics.stages.items():
+            self.add_stage(name, record["seconds"], record["calls"])
+        self.repos[repo_id] = {"stages": repo_metrics.stages, **repo_metrics.counts}
+
+    def repo_totals(self) -> dict:
+        """
+        returns the counts of the repos summed over all of them. Counts made of
+        several values, like the retries of every sampler, are summed by key.
+        """
+        totals = {}
+        for repo in self.repos.values():
+            for key, value in repo.items():
+                if key in ("stages", "peak_rss_bytes"):
+                    continue
+                if isinstance(value, dict):
+                    total = totals.setdefault(key, {})
+                    for k, v in value.items():
+                        total[k] = total.get(k, 0) + v
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": self.stages,
+            "counts": self.counts,
+            "repo_totals": self.repo_totals(),
+            "peak_rss_bytes": peak_rss(),
+            "workers_peak_rss_bytes": peak_rss(children=True),
+            "repos": self.repos,
+        }
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class Progress:
+    """
+    Logs the progress of a loop at most once every `interval` seconds, and once
+    when it completes.
+    """
+    __slots__ = ("label", "total", "interval", "done", "_start", "_last")
+
+    def __init__(self, label:str, total:int, interval:float=5.):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self._start = self._last = time.perf_counter()
+
+    def update(self, n:int=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self._last < self.interval and self.done < self.total:
+            return
+        self._last = now
+        rate = self.done / max(now - self._start, 1e-9)
+        logging.info(f"{self.label}: {self.done}/{self.total} ({rate:.1f}/s)")
@@ -0,0 +1,203 @@
+import io
+import os
+from pathlib import Path
+from typing import IO, Annotated, Optional, Tuple
+import numpy as np
+
+from src.tags import Issue
+from src.sparse import SparseMatrix, FileAuthors
+from src.writer import MarkovWriter, open_markov
+from src.transitions import NodeBlock, TransitionStore
+from src.issues import ISSUE_CHUNK, IssueMatrix
+from src.rng import RandomStreams
+from src.ids import IdTable
+from src.artifacts import ArtifactStore
+from src.metrics import Metrics
+from src.cache import StageCache
+from src.validation import Validator
+from src.generator import (
+    first_appearance,
+    build_file_transitions,
+    build_module_transitions,
+    build_issue_transitions,
+    issue_chunk_draws,
+    usable_cache,
+    prepare_data,
+    map_repos,
+)
+
+
+class MarkovModel:
+    """
+    Markov configuration of a repo held in memory: the issue sequence with the
+    average consecutive commits of every issue, and the transitions of the nodes
+    as TransitionStores in the order they are written (Initial and issues, files,
+    modules and authors). Names are only formatted when the model is written.
+    """
+    __slots__ = ("repo_id", "issue_sequence", "average_consecutive_commits", "transitions")
+
+    def __init__(
+        self,
+        repo_id:str,
+        issue_sequence:NodeBlock,
+        average_consecutive_commits:np.ndarray,
+        transitions:list[TransitionStore]
+    ):
+        assert len(issue_sequence) == len(average_consecutive_commits)
+        self.repo_id = repo_id
+        self.issue_sequence = issue_sequence
+        self.average_consecutive_commits = average_consecutive_commits
+        self.transitions = transitions
+
+    @property
+    def filename(self) -> str:
+        return f"markov_{self.repo_id}.yaml"
+
+    def write(self, f:IO[str]) -> int:
+        """
+        writes the model in the markov configuration format and returns the number
+        of characters written.
+        """
+        writer = MarkovWriter(f)
+        writer.issue_sequence(self.issue_sequence.labels(), self.average_consecutive_commits.tolist())
+        writer.transitions()
+        for store in self.transitions:
+            writer.store(store)
+        return writer.bytes_written
+
+    def save(self, path_to_output:str) -> Path:
+        """
+        writes the model to markov_<repo-ID>.yaml in path_to_output.
+        """
+        path_to_markov = Path(path_to_output) / self.filename
+        with open_markov(path_to_markov) as f:
+            self.write(f)
+        return path_to_markov
+
+    def to_yaml(self) -> str:
+        f = io.StringIO()
+        self.write(f)
+        return f.getvalue()
+
+    def to_dict(self) -> dict:
+        """
+        returns the model with the layout of the markov configuration file, nodes
+        being keyed by their tagged name, e.g. "!File File_3".
+        """
+        matrix = {}
+        for store in self.transitions:
+            labels = store.labels()
+            for source, targets, p in store.rows():
+                matrix[labels[source]] = [{"to": t, "p": v} for t, v in zip(labels[targets].tolist(), p.tolist())]
+        return {
+            "issue_sequence": {"average_consecutive_commits": dict(zip(
+                self.issue_sequence.labels(), self.average_consecutive_commits.tolist()
+            ))},
+            "transitions": {"matrix": matrix},
+        }
+
+
+def issue_draws(streams:RandomStreams, repo:int, lam:float, issuematrix:"SparseMatrix | IssueMatrix") -> Tuple[
+    Annotated[SparseMatrix, "issues"],
+    Annotated[np.ndarray, "average_consecutive_commits"],
+    Annotated[np.ndarray, "weights"],
+    Annotated[np.ndarray, "initial"]
+]:
+    """
+    returns the non-empty rows of the issue matrix of a repo, with the average
+    consecutive commits, the weight and the Initial probability of every issue,
+    drawn from the same streams as write_repo_markov.
+    """
+    chunks = []
+    total = 0.
+    for c, chunk in enumerate(issuematrix.row_chunks(ISSUE_CHUNK)):
+        rows = np.flatnonzero(np.diff(chunk.indptr))
+        average_consecutive_commits, weights = issue_chunk_draws(streams, repo, c, len(rows), lam)
+        chunks.append((chunk.take_rows(rows), average_consecutive_commits, weights))
+        total += weights.sum()
+    weights = np.concatenate([w for _, _, w in chunks])
+    return (
+        SparseMatrix.vstack([chunk for chunk, _, _ in chunks]),
+        np.concatenate([n for _, n, _ in chunks]),
+        weights,
+        np.concatenate([w / total for _, _, w in chunks]),
+    )
+
+
+def repo_model(
+    ids:IdTable,
+    repo:int,
+    issues:SparseMatrix,
+    average_consecutive_commits:np.ndarray,
+    initial:np.ndarray,
+    filematrix:SparseMatrix,
+    fileauthors:FileAuthors,
+    modulematrix:SparseMatrix
+) -> MarkovModel:
+    """
+    Builds the markov model of a repo from its matrices, issues being the non-empty
+    rows of its issue matrix with their draws, see issue_draws.
+    """
+    return MarkovModel(
+        ids.repos.name(repo),
+        NodeBlock(Issue, ids.issues, issues.index),
+        average_consecutive_commits,
+        [
+            build_issue_transitions(ids, issues, initial),
+            build_file_transitions(ids, filematrix, fileauthors),
+            build_module_transitions(ids, modulematrix, first_appearance(fileauthors.authors)),
+        ]
+    )
+
+
+def build_repo_model(
+    streams:RandomStreams,
+    ids:IdTable,
+    repo:int,
+    config:dict,
+    filematrix:SparseMatrix,
+    fileauthors:FileAuthors,
+    modulematrix:SparseMatrix,
+    issuematrix:"SparseMatrix | IssueMatrix"
+) -> MarkovModel:
+    """
+    Builds the markov model of a repo from its matrices. It draws from the same
+    streams as write_repo_markov, so the written model is the file generate_markov
+    writes for the same seed.
+    """
+    issues, average_consecutive_commits, _, initial = issue_draws(streams, repo, config["Issues"]["lambda"], issuematrix)
+    return repo_model(ids, repo, issues, average_consecutive_commits, initial, filematrix, fileauthors, modulematrix)
+
+
+def generate_models(
+    config:"str | dict",
+    n_split:int=1,
+    seed:Optional[int]=None,
+    workers:int=1,
+    metrics:Optional[Metrics]=None,
+    cache:Optional[StageCache]=None,
+    validator:Optional[Validator]=None
+) -> list[MarkovModel]:
+    """
+    Generates the markov models of n_split repos from a configuration file or its
+    content, in memory: no artifacts nor markov files are written, see save_models.
+    Matrices are checked at the level of validator (every row by default).
+    """
+    metrics = metrics or Metrics()
+    validator = validator or Validator()
+    streams = RandomStreams(seed)
+    cache = usable_cache(cache, seed)
+    data = prepare_data(config, n_split, streams, metrics, cache)
+    config, ids = data[0], data[1]
+    results = map_repos(data, streams, ArtifactStore(fmt="none"), None, workers, metrics, cache, validator=validator)
+    validator.raise_on_violations()
+    with metrics.stage("build_models"):
+        return [build_repo_model(streams, ids, i, config, *matrices) for i, matrices in enumerate(results)]
+
+
+def save_models(models:list[MarkovModel], path_to_output:str) -> list[Path]:
+    """
+    writes every model to markov_<repo-ID>.yaml in path_to_output.
+    """
+    os.makedirs(path_to_output, exist_ok=True)
+    return [model.save(path_to_output) for model in models]
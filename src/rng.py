@@ -0,0 +1,40 @@
+import numpy as np
+from typing import Optional
+
+# every stage draws from its own stream, so its output does not depend on which
+# stages ran before it. Per repo stages are further keyed by the repo number.
+STAGES = {
+    "files": 0,
+    "modules": 1,
+    "authors": 2,
+    "split": 3,
+    "module_files": 4,
+    "issue_modules": 5,
+    "filematrix": 6,
+    "modulematrix": 7,
+    "issuematrix": 8,
+    "markov": 9,
+    "evolution": 10,
+}
+
+
+class RandomStreams:
+    """
+    Derives independent random generators for every stage and repo from a single
+    seed using numpy SeedSequence spawn keys. Instances are cheap to pickle, so
+    worker processes rebuild exactly the same streams as the parent.
+    """
+    __slots__ = ("entropy",)
+
+    def __init__(self, seed:Optional[int]=None):
+        self.entropy = np.random.SeedSequence(seed).entropy
+
+    def seed_sequence(self, stage:str, *key:int) -> np.random.SeedSequence:
+        return np.random.SeedSequence(self.entropy, spawn_key=(STAGES[stage], *key))
+
+    def generator(self, stage:str, *key:int) -> np.random.Generator:
+        """
+        returns the generator of the given stage, e.g. generator("filematrix", 2)
+        for the file matrix of the third repo.
+        """
+        return np.random.default_rng(self.seed_sequence(stage, *key))
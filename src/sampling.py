@@ -0,0 +1,97 @@
+import numpy as np
+
+# number of corrections applied to move the rounding residual of a simplex draw
+MAX_CORRECTIONS = 4
+
+# rejected draws per sampler, exposed for instrumentation
+RETRIES = {"filegroup": 0, "module": 0, "issue": 0}
+
+
+def get_retries() -> dict:
+    return dict(RETRIES)
+
+
+def reset_retries():
+    for key in RETRIES:
+        RETRIES[key] = 0
+
+
+def sample_positive_poisson(rng:np.random.Generator, lam:float, size:int) -> np.ndarray:
+    """
+    Draws `size` Poisson(lam) integers conditioned on being != 0, redrawing the
+    zeros in vectorized batches.
+    """
+    if lam <= 0:
+        return np.ones(size, dtype=np.int64)
+    n = rng.poisson(lam=lam, size=size)
+    zeros = np.flatnonzero(n == 0)
+    while len(zeros):
+        n[zeros] = rng.poisson(lam=lam, size=len(zeros))
+        zeros = zeros[n[zeros] == 0]
+    return n
+
+
+def sample_group_blocks(rng:np.random.Generator, n:int, p:np.ndarray) -> np.ndarray:
+    """
+    Samples the n x n transition blocks of len(p) FileGroups of n files at once,
+    the rows of block g summing to p[g].
+
+    Each row is uniform on {x > 0, sum(x) = p}, which is the distribution of a
+    Dirichlet(1, ..., 1) row conditioned on all entries being > (1 - p) / n minus
+    (1 - p) / n: the uniform distribution restricted to that shifted simplex is
+    uniform, so scaling a single draw by p is exact and needs no rejection. Rows
+    are drawn as normalized standard exponentials.
+    """
+    blocks = np.empty((len(p), n, n))
+    todo = np.arange(len(p))
+    while len(todo):
+        e = rng.standard_exponential((len(todo), n, n))
+        e *= (p[todo, None] / e.sum(axis=2))[:, :, None]
+        blocks[todo] = e
+        # entries can only be 0 through floating point underflow
+        redraw = ~(e > 0.).all(axis=(1, 2))
+        RETRIES["filegroup"] += int(redraw.sum())
+        todo = todo[redraw]
+    return blocks
+
+
+def sample_ungrouped_block(rng:np.random.Generator, n:int, threshold:float=0.05) -> np.ndarray:
+    """
+    Samples the n x n transition block of the ungrouped files, dropping transitions
+    below threshold / n.
+    """
+    if not n:
+        return np.zeros((0, 0))
+    A = rng.dirichlet(np.ones(n), n) - threshold / n
+    A[A < 0] = 0.0
+    return A
+
+
+def sample_simplex_rows(rng:np.random.Generator, rows:np.ndarray, n_rows:int, counter:str) -> np.ndarray:
+    """
+    Samples one Dirichlet(1, ..., 1) vector per row for entries labelled with their
+    (sorted) row number, all rows at once as normalized standard exponentials.
+
+    The rounding residual of each row is moved onto its largest entry and then onto
+    its smallest one, so that its sequential float sum is exactly 1.0. The few rows
+    where the residual cannot be absorbed are redrawn and counted in
+    RETRIES[counter].
+    """
+    p = np.empty(len(rows), dtype=float)
+    todo = np.arange(len(rows))
+    while len(todo):
+        r = rows[todo]
+        e = rng.standard_exponential(len(todo))
+        p[todo] = e / np.bincount(r, weights=e, minlength=n_rows)[r]
+        # positions in todo of the smallest and largest entry of every row
+        order = np.lexsort((p[todo], r))
+        last = np.flatnonzero(np.append(r[order][1:] != r[order][:-1], True))
+        first = np.append(0, last[:-1] + 1)
+        for k in range(MAX_CORRECTIONS):
+            residual = 1.0 - np.bincount(r, weights=p[todo], minlength=n_rows)
+            target = todo[order[first if k else last]]
+            p[target] += residual[rows[target]]
+        failed = (np.bincount(r, weights=p[todo], minlength=n_rows) != 1.0)[r]
+        todo = todo[failed]
+        RETRIES[counter] += len(np.unique(rows[todo]))
+    return p
@@ -0,0 +1,194 @@
+import numpy as np
+from typing import Annotated, Iterator, Tuple
+
+from src.ids import NameIndex
+
+
+class SparseMatrix:
+    """
+    Labelled matrix stored in compressed sparse row (CSR) format. Only non-zero
+    transitions are kept, so memory grows with the number of edges. Rows and
+    columns are labelled with the integer ids of an IdTable.
+    """
+    __slots__ = ("indptr", "indices", "data", "index", "columns")
+
+    def __init__(self, indptr:np.ndarray, indices:np.ndarray, data:np.ndarray, index:list, columns:list):
+        assert len(indptr) == len(index) + 1, "indptr must have one entry more than the rows."
+        assert len(indices) == len(data) == indptr[-1], "indices and data must match indptr."
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.index = np.asarray(index)
+        self.columns = np.asarray(columns)
+
+    @classmethod
+    def from_dense(cls, values:np.ndarray, index:list, columns:list) -> "SparseMatrix":
+        """
+        compresses a dense 2d array, keeping only the entries > 0.
+        """
+        rows, cols = np.nonzero(values > 0.)
+        indptr = np.zeros(values.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=values.shape[0]), out=indptr[1:])
+        return cls(indptr, cols, values[rows, cols], index, columns)
+
+    @classmethod
+    def from_coo(cls, rows:np.ndarray, cols:np.ndarray, data:np.ndarray, index:list, columns:list) -> "SparseMatrix":
+        """
+        builds a matrix from the row and column positions of its entries, summing
+        the values of duplicate positions.
+        """
+        n_rows, n_cols = len(index), len(columns)
+        keys = np.asarray(rows, dtype=np.int64) * n_cols + cols
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1])) if len(keys) else keys[:0]
+        keys = keys[starts]
+        data = np.add.reduceat(np.asarray(data, dtype=float)[order], starts) if len(keys) else np.zeros(0)
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_cols, minlength=n_rows), out=indptr[1:])
+        return cls(indptr, keys % n_cols, data, index, columns)
+
+    @classmethod
+    def vstack(cls, matrices:list) -> "SparseMatrix":
+        """
+        stacks matrices sharing the same columns on top of each other.
+        """
+        assert len(matrices), "at least one matrix is needed."
+        offsets = np.cumsum([0] + [m.nnz for m in matrices[:-1]])
+        indptr = np.concatenate([[0]] + [m.indptr[1:] - m.indptr[0] + o for m, o in zip(matrices, offsets)])
+        return cls(
+            indptr.astype(np.int64),
+            np.concatenate([m.indices for m in matrices]),
+            np.concatenate([m.data for m in matrices]),
+            np.concatenate([m.index for m in matrices]),
+            matrices[0].columns,
+        )
+
+    @classmethod
+    def block_diag(cls, matrices:list) -> "SparseMatrix":
+        """
+        stacks matrices on the diagonal, the columns of each following the columns
+        of the previous ones.
+        """
+        assert len(matrices), "at least one matrix is needed."
+        matrix = cls.vstack(matrices)
+        offsets = np.cumsum([0] + [len(m.columns) for m in matrices[:-1]])
+        matrix.indices = np.concatenate([m.indices + o for m, o in zip(matrices, offsets)])
+        matrix.columns = np.concatenate([m.columns for m in matrices])
+        return matrix
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.index), len(self.columns)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def row_ids(self) -> np.ndarray:
+        """
+        returns the row number of every stored entry.
+        """
+        return np.repeat(np.arange(len(self.index)), np.diff(self.indptr))
+
+    def row_sums(self) -> np.ndarray:
+        return np.bincount(self.row_ids(), weights=self.data, minlength=len(self.index))
+
+    def row(self, i:int) -> Tuple[Annotated[np.ndarray, "indices"], Annotated[np.ndarray, "data"]]:
+        """
+        returns column positions and values of the non-zero entries of row i.
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def slice_rows(self, a:int, b:int) -> "SparseMatrix":
+        """
+        returns the rows from a to b.
+        """
+        start, end = self.indptr[a], self.indptr[b]
+        return SparseMatrix(
+            self.indptr[a:b + 1] - start, self.indices[start:end], self.data[start:end], self.index[a:b], self.columns
+        )
+
+    def row_chunks(self, size:int) -> Iterator["SparseMatrix"]:
+        """
+        yields the matrix in slices of size rows, at least one even without rows.
+        """
+        for a in range(0, max(len(self.index), 1), size):
+            yield self.slice_rows(a, min(a + size, len(self.index)))
+
+    def entry_chunks(self, size:int) -> Iterator["SparseMatrix"]:
+        """
+        yields the matrix in slices of consecutive rows holding about size stored
+        entries, a row starting past a multiple of size starting a new slice. At
+        least one slice is yielded even without rows.
+        """
+        slices = self.indptr[:-1] // size
+        bounds = np.append(np.flatnonzero(np.append(True, slices[1:] != slices[:-1])), len(self.index))
+        for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            yield self.slice_rows(a, b)
+
+    def take_rows(self, rows:np.ndarray) -> "SparseMatrix":
+        """
+        returns the given rows, in their order.
+        """
+        counts = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        entries = np.repeat(self.indptr[rows] - indptr[:-1], counts) + np.arange(indptr[-1])
+        return SparseMatrix(indptr, self.indices[entries], self.data[entries], self.index[rows], self.columns)
+
+    def to_edges(self, index_names:NameIndex, column_names:NameIndex, source:str="source", target:str="target", value:str="p") -> dict:
+        """
+        returns the non-zero entries as parallel (source, target, value) columns,
+        with rows and columns ids replaced by their names.
+        """
+        return {
+            source: index_names.names(self.index[self.row_ids()]),
+            target: column_names.names(self.columns[self.indices]),
+            value: self.data,
+        }
+
+
+class FileAuthors:
+    """
+    Author of every file of a repo with the probability of the file to author
+    transition, as parallel arrays: file index[k] goes to authors[k] with p[k].
+    """
+    __slots__ = ("index", "authors", "p")
+
+    def __init__(self, index:np.ndarray, authors:np.ndarray, p:np.ndarray):
+        assert len(index) == len(authors) == len(p), "files, authors and p must have the same length."
+        self.index = np.asarray(index)
+        self.authors = np.asarray(authors)
+        self.p = np.asarray(p, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def row_chunks(self, size:int) -> Iterator["FileAuthors"]:
+        """
+        yields the table in slices of size files, at least one even without files.
+        """
+        for a in range(0, max(len(self.index), 1), size):
+            yield FileAuthors(self.index[a:a + size], self.authors[a:a + size], self.p[a:a + size])
+
+    @classmethod
+    def concat(cls, tables:list) -> "FileAuthors":
+        assert len(tables), "at least one table is needed."
+        return cls(
+            np.concatenate([t.index for t in tables]),
+            np.concatenate([t.authors for t in tables]),
+            np.concatenate([t.p for t in tables]),
+        )
+
+    def to_frame(self, file_names:NameIndex, author_names:NameIndex) -> "pd.DataFrame":
+        """
+        returns the table as a DataFrame indexed by file name. pandas is only
+        imported here.
+        """
+        import pandas as pd
+        return pd.DataFrame(
+            {"AuthorName": author_names.names(self.authors), "AuthorProb": self.p},
+            index=file_names.names(self.index)
+        )
@@ -0,0 +1,171 @@
+import copy
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Annotated, Optional, Tuple
+import yaml
+
+from src.artifacts import ArtifactStore
+from src.cache import StageCache, digest, section
+from src.generator import generate_markov
+from src.metrics import Metrics
+
+
+def parse_override(text:str) -> Tuple[
+    Annotated[str, "key"],
+    Annotated[list, "values"]
+]:
+    """
+    parses a "Section.key=value1,value2" override, e.g. "Issues.number=100,1000".
+    Values are parsed as YAML scalars.
+    """
+    key, _, values = text.partition("=")
+    assert key and values, f"overrides must look like Section.key=value1,value2, got {text}"
+    return key, [yaml.safe_load(value) for value in values.split(",")]
+
+
+def apply_overrides(config:dict, overrides:dict) -> dict:
+    """
+    returns a copy of config where every "Section.key" of overrides is replaced.
+    """
+    config = copy.deepcopy(config)
+    for key, value in overrides.items():
+        *path, last = key.split(".")
+        node = config
+        for part in path:
+            node = node[part]
+        assert last in node, f"unknown config key {key}"
+        node[last] = value
+    return config
+
+
+class Variant:
+    """
+    One run of a sweep: a config with its overrides, a seed and a number of repos.
+    """
+    __slots__ = ("config_path", "overrides", "seed", "split")
+
+    def __init__(self, config_path:str, overrides:dict, seed:int, split:int):
+        self.config_path = str(config_path)
+        self.overrides = overrides
+        self.seed = seed
+        self.split = split
+
+    @property
+    def name(self) -> str:
+        parts = [Path(self.config_path).stem]
+        parts += [f"{key}-{value}" for key, value in self.overrides.items()]
+        parts += [f"seed-{self.seed}", f"split-{self.split}"]
+        return "_".join(parts)
+
+    def config(self) -> dict:
+        with open(self.config_path) as f:
+            return apply_overrides(yaml.safe_load(f), self.overrides)
+
+    def file_stages_key(self) -> str:
+        """
+        returns the digest of the inputs of the file matrices, which are the most
+        expensive stage: variants with the same key share them through the cache.
+        """
+        config = self.config()
+        return digest(section(config, "Files"), section(config, "Authors"), self.seed, self.split)
+
+
+def expand_variants(configs:list, seeds:list, splits:list, overrides:list) -> list[Variant]:
+    """
+    returns the variants of the grid of configs, override values, seeds and splits.
+    overrides is a list of (key, values) pairs.
+    """
+    keys = [key for key, _ in overrides]
+    return [
+        Variant(config_path, dict(zip(keys, values)), seed, split)
+        for config_path, *values, seed, split in product(configs, *[v for _, v in overrides], seeds, splits)
+    ]
+
+
+def run_variant(variant:Variant, path_to_output:str, cache_dir:Optional[str], tmp_format:str) -> dict:
+    """
+    Generates the markov configs of a variant in its own directory, next to the
+    config it was generated from and its metrics. Returns the summary of the run,
+    failures are logged and reported rather than raised.
+    """
+    out_dir = Path(path_to_output) / variant.name
+    os.makedirs(out_dir, exist_ok=True)
+    result = {
+        "name": variant.name,
+        "config": variant.config_path,
+        "overrides": variant.overrides,
+        "seed": variant.seed,
+        "split": variant.split,
+    }
+    metrics = Metrics()
+    start = time.perf_counter()
+    try:
+        path_to_config = out_dir / "config.yaml"
+        with open(path_to_config, "w") as f:
+            yaml.safe_dump(variant.config(), f, sort_keys=False)
+        generate_markov(
+            path_to_config,
+            variant.split,
+            out_dir,
+            seed=variant.seed,
+            artifacts=ArtifactStore(out_dir / "tmp", tmp_format),
+            metrics=metrics,
+            cache=StageCache(cache_dir)
+        )
+        metrics.save(out_dir / "metrics.json")
+        result["status"] = "ok"
+    except Exception as e:
+        logging.exception(f"Variant {variant.name} failed")
+        result["status"] = f"error: {e!r}"
+    result["seconds"] = time.perf_counter() - start
+    result["output_bytes"] = metrics.repo_totals().get("output_bytes", 0)
+    logging.info(f"Variant {variant.name}: {result['status']} in {result['seconds']:.2f}s")
+    return result
+
+
+def run_variant_task(args:tuple) -> dict:
+    return run_variant(*args)
+
+
+def run_sweep(
+    variants:list[Variant],
+    path_to_output:str,
+    workers:int=1,
+    cache_dir:Optional[str]=None,
+    tmp_format:str="none"
+) -> list[dict]:
+    """
+    Runs every variant, in a pool of worker processes if workers > 1, and writes a
+    summary of the runs to sweep.json in path_to_output.
+
+    Variants share identical stages through the stage cache, which defaults to
+    .cache in path_to_output. Variants are run in two waves: the first computes
+    the file matrices of every distinct Files, Authors, seed and split, the second
+    runs the variants that can reuse them.
+    """
+    os.makedirs(path_to_output, exist_ok=True)
+    cache_dir = cache_dir or str(Path(path_to_output) / ".cache")
+    seen = set()
+    waves = ([], [])
+    for variant in variants:
+        key = variant.file_stages_key()
+        waves[key in seen].append(variant)
+        seen.add(key)
+    logging.info(f"Sweeping {len(variants)} variants, {len(waves[0])} distinct file matrices.")
+
+    results = []
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for wave in waves:
+                results += pool.map(run_variant_task, [(v, path_to_output, cache_dir, tmp_format) for v in wave])
+    else:
+        results = [run_variant(v, path_to_output, cache_dir, tmp_format) for wave in waves for v in wave]
+
+    with open(Path(path_to_output) / "sweep.json", "w") as f:
+        json.dump(results, f, indent=2)
+    return results
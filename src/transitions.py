@@ -0,0 +1,129 @@
+import numpy as np
+from typing import Annotated, Iterator, Optional, Tuple
+
+from src.ids import NameIndex
+from src.tags import tag
+from src.writer import tagged
+
+
+class NodeBlock:
+    """
+    Consecutive nodes of one kind, e.g. the files of a repo. Node k of the block
+    is the entity ids[k] of names, tagged with cls. Without names the block is the
+    single node of cls (Initial, Commit).
+    """
+    __slots__ = ("cls", "names", "ids")
+
+    def __init__(self, cls:type[tag], names:Optional[NameIndex]=None, ids:Optional[np.ndarray]=None):
+        self.cls = cls
+        self.names = names
+        self.ids = np.zeros(1, dtype=np.int64) if names is None else np.asarray(ids, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def labels(self) -> list[str]:
+        if self.names is None:
+            return [str(self.cls(" "))]
+        return tagged(self.cls, self.names.names(self.ids))
+
+
+class TransitionStore:
+    """
+    Transitions of a markov model as parallel arrays. Nodes are numbered block by
+    block and the outgoing transitions of the written nodes are stored in CSR form:
+    the transitions of sources[k] go to targets[indptr[k]:indptr[k + 1]] with
+    probabilities p[indptr[k]:indptr[k + 1]]. Names are only formatted by labels.
+    """
+    __slots__ = ("blocks", "sources", "indptr", "targets", "p")
+
+    def __init__(self, blocks:list, sources:np.ndarray, indptr:np.ndarray, targets:np.ndarray, p:np.ndarray):
+        assert len(indptr) == len(sources) + 1, "indptr must have one entry more than the sources."
+        assert len(targets) == len(p) == indptr[-1], "targets and p must match indptr."
+        self.blocks = blocks
+        self.sources = sources
+        self.indptr = indptr
+        self.targets = targets
+        self.p = p
+
+    @property
+    def n_nodes(self) -> int:
+        return sum(len(block) for block in self.blocks)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.p)
+
+    def labels(self) -> np.ndarray:
+        """
+        returns the tagged name of every node, e.g. "!File File_3".
+        """
+        labels = np.empty(self.n_nodes, dtype=object)
+        offset = 0
+        for block in self.blocks:
+            labels[offset:offset + len(block)] = block.labels()
+            offset += len(block)
+        return labels
+
+    def row(self, k:int) -> Tuple[Annotated[np.ndarray, "targets"], Annotated[np.ndarray, "p"]]:
+        a, b = self.indptr[k], self.indptr[k + 1]
+        return self.targets[a:b], self.p[a:b]
+
+    def rows(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        yields the source, targets and probabilities of every written node, in order.
+        """
+        for k, source in enumerate(self.sources.tolist()):
+            yield source, *self.row(k)
+
+    def row_sums(self) -> np.ndarray:
+        return np.bincount(
+            np.repeat(np.arange(len(self.sources)), np.diff(self.indptr)), weights=self.p, minlength=len(self.sources)
+        )
+
+
+class TransitionStoreBuilder:
+    """
+    Incrementally assembles a TransitionStore: node blocks are added first, then
+    the rows of their nodes in output order.
+    """
+    def __init__(self):
+        self.__blocks = []
+        self.__offset = 0
+        self.__sources = []
+        self.__counts = []
+        self.__targets = []
+        self.__p = []
+
+    def add_block(self, cls:type[tag], names:Optional[NameIndex]=None, ids:Optional[np.ndarray]=None) -> int:
+        """
+        adds a block of nodes and returns the node number of its first node.
+        """
+        block = NodeBlock(cls, names, ids)
+        offset = self.__offset
+        self.__blocks.append(block)
+        self.__offset += len(block)
+        return offset
+
+    def add_rows(self, sources:np.ndarray, indptr:np.ndarray, targets:np.ndarray, p:np.ndarray):
+        """
+        appends the transitions of sources, in CSR form over node numbers.
+        """
+        assert len(indptr) == len(sources) + 1 and len(targets) == len(p) == indptr[-1] - indptr[0]
+        assert not len(targets) or (0 <= targets.min() and targets.max() < self.__offset), "targets must be added nodes."
+        self.__sources.append(np.asarray(sources, dtype=np.int64))
+        self.__counts.append(np.diff(indptr))
+        self.__targets.append(np.asarray(targets, dtype=np.int64))
+        self.__p.append(np.asarray(p, dtype=float))
+
+    def build(self) -> TransitionStore:
+        counts = np.concatenate(self.__counts) if self.__counts else np.zeros(0, dtype=np.int64)
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return TransitionStore(
+            self.__blocks,
+            np.concatenate(self.__sources) if self.__sources else np.zeros(0, dtype=np.int64),
+            indptr,
+            np.concatenate(self.__targets) if self.__targets else np.zeros(0, dtype=np.int64),
+            np.concatenate(self.__p) if self.__p else np.zeros(0, dtype=float),
+        )
@@ -0,0 +1,174 @@
+import json
+import logging
+import numpy as np
+from typing import Annotated, Optional, Tuple
+
+from src.ids import IdTable, NameIndex
+from src.sparse import SparseMatrix, FileAuthors
+
+OUTPUT_ROUNDING = 6
+VALIDATION_LEVELS = ("off", "sampled", "full")
+# rows checked per matrix, or per chunk of issues, at the sampled level
+SAMPLED_ROWS = 1024
+# violating rows reported for every check of a repo
+MAX_EXAMPLES = 5
+
+
+def row_entries(matrix:SparseMatrix, rows:np.ndarray) -> Tuple[
+    Annotated[np.ndarray, "entries"],
+    Annotated[np.ndarray, "positions"]
+]:
+    """
+    returns the stored entries of the given rows and, for every entry, the
+    position in rows of its row.
+    """
+    counts = matrix.indptr[rows + 1] - matrix.indptr[rows]
+    positions = np.repeat(np.arange(len(rows)), counts)
+    starts = np.repeat(matrix.indptr[rows] - np.cumsum(counts) + counts, counts)
+    return starts + np.arange(len(positions)), positions
+
+
+def rows_sums(matrix:SparseMatrix, rows:np.ndarray) -> np.ndarray:
+    entries, positions = row_entries(matrix, rows)
+    return np.bincount(positions, weights=matrix.data[entries], minlength=len(rows))
+
+
+def sums_to_one(values:np.ndarray) -> np.ndarray:
+    return np.round(values, OUTPUT_ROUNDING) == 1
+
+
+class Validator:
+    """
+    Checks the invariants of the generated transitions in bulk: rows of files
+    (with their author transition), modules, issues and the Initial node must sum
+    up to 1 and file and module transitions must stay in their repo. "full" checks
+    every row, "sampled" SAMPLED_ROWS random rows per matrix or chunk of issues and
+    "off" nothing. Violations are collected by check and repo instead of being
+    raised one at a time, see report and raise_on_violations.
+    """
+    __slots__ = ("level", "rng", "checked", "violations")
+
+    def __init__(self, level:str="full", seed:int=0):
+        assert level in VALIDATION_LEVELS, f"validation level must be one of {VALIDATION_LEVELS}"
+        self.level = level
+        # rows are sampled from their own stream, never from the generation streams
+        self.rng = np.random.default_rng(seed)
+        self.checked = {}
+        self.violations = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.level != "off"
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+    def select(self, n:int) -> np.ndarray:
+        """
+        returns the rows to check among n rows.
+        """
+        if self.level == "full" or n <= SAMPLED_ROWS:
+            return np.arange(n)
+        return np.sort(self.rng.choice(n, SAMPLED_ROWS, replace=False))
+
+    def expect(
+        self,
+        check:str,
+        repo_id:str,
+        valid:np.ndarray,
+        values:np.ndarray,
+        names:Optional[NameIndex]=None,
+        ids:Optional[np.ndarray]=None
+    ):
+        """
+        records the rows of a check where valid is False, with their value. Rows are
+        reported by name if the names and ids of the rows are given.
+        """
+        self.checked[check] = self.checked.get(check, 0) + len(valid)
+        bad = np.flatnonzero(~valid)
+        if not len(bad):
+            return
+        violation = self.violations.setdefault((check, repo_id), {"check": check, "repo": repo_id, "rows": 0, "examples": []})
+        violation["rows"] += len(bad)
+        bad = bad[:MAX_EXAMPLES - len(violation["examples"])]
+        labels = names.names(ids[bad]) if names is not None else [str(row) for row in bad.tolist()]
+        violation["examples"] += [{"row": label, "value": float(value)} for label, value in zip(labels, values[bad])]
+
+    def check_files(self, repo_id:str, ids:IdTable, repo:int, filematrix:SparseMatrix, fileauthors:FileAuthors):
+        """
+        checks the rows of a file matrix, or batch of it, with their author.
+        """
+        if not self.enabled:
+            return
+        rows = self.select(len(filematrix.index))
+        files = filematrix.index[rows]
+        p = fileauthors.p[rows]
+        sums = rows_sums(filematrix, rows) + p
+        self.expect("file_sums", repo_id, sums_to_one(sums), sums, ids.files, files)
+        self.expect("file_author_p", repo_id, (p >= 0) & (p <= 1), p, ids.files, files)
+        entries, positions = row_entries(filematrix, rows)
+        leaving = np.bincount(
+            positions, weights=ids.file_repo[filematrix.columns[filematrix.indices[entries]]] != repo, minlength=len(rows)
+        )
+        self.expect("file_targets", repo_id, leaving == 0, leaving, ids.files, files)
+
+    def check_modules(self, repo_id:str, ids:IdTable, repo:int, modulematrix:SparseMatrix):
+        """
+        checks the non-empty rows of a module matrix.
+        """
+        if not self.enabled:
+            return
+        nonempty = np.flatnonzero(np.diff(modulematrix.indptr))
+        rows = nonempty[self.select(len(nonempty))]
+        modules = modulematrix.index[rows]
+        sums = rows_sums(modulematrix, rows)
+        self.expect("module_sums", repo_id, sums_to_one(sums), sums, ids.modules, modules)
+        entries, positions = row_entries(modulematrix, rows)
+        leaving = np.bincount(
+            positions, weights=ids.file_repo[modulematrix.columns[modulematrix.indices[entries]]] != repo, minlength=len(rows)
+        )
+        self.expect("module_targets", repo_id, leaving == 0, leaving, ids.modules, modules)
+
+    def check_issues(self, repo_id:str, ids:IdTable, issuematrix:SparseMatrix):
+        """
+        checks the non-empty rows of an issue matrix, or chunk of it.
+        """
+        if not self.enabled:
+            return
+        nonempty = np.flatnonzero(np.diff(issuematrix.indptr))
+        rows = nonempty[self.select(len(nonempty))]
+        sums = rows_sums(issuematrix, rows)
+        self.expect("issue_sums", repo_id, sums_to_one(sums), sums, ids.issues, issuematrix.index[rows])
+
+    def check_initial(self, repo_id:str, total:float):
+        """
+        checks the sum of the transitions of the Initial node.
+        """
+        if not self.enabled:
+            return
+        values = np.array([total])
+        self.expect("initial_sums", repo_id, sums_to_one(values), values)
+
+    def merge(self, other:"Validator"):
+        for check, n in other.checked.items():
+            self.checked[check] = self.checked.get(check, 0) + n
+        self.violations.update(other.violations)
+
+    def report(self) -> dict:
+        return {"level": self.level, "checked": self.checked, "violations": list(self.violations.values())}
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def raise_on_violations(self):
+        """
+        logs every violation and raises a single AssertionError if there is any.
+        """
+        if self.ok:
+            return
+        for violation in self.violations.values():
+            examples = ", ".join(f"{e['row']} ({e['value']:g})" for e in violation["examples"])
+            logging.error(f"{violation['check']} failed in {violation['rows']} rows of {violation['repo']}: {examples}")
+        raise AssertionError(f"{len(self.violations)} validation checks failed, see the log or the validation report.")
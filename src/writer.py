@@ -0,0 +1,248 @@
+import queue
+import threading
+from typing import IO, Iterable, Optional
+
+from src.tags import tag
+from src.metrics import Progress
+
+WRITE_BUFFER = 1 << 20
+# blocks of WRITE_BUFFER characters queued for a BackgroundWriter at most
+WRITE_QUEUE = 8
+
+
+def format_float(value:float) -> str:
+    """
+    formats a float the same way PyYAML's representer does.
+    """
+    if value != value:
+        return ".nan"
+    if value == float("inf"):
+        return ".inf"
+    if value == -float("inf"):
+        return "-.inf"
+    text = repr(float(value)).lower()
+    if "." not in text and "e" in text:
+        text = text.replace("e", ".0e", 1)
+    return text
+
+
+def tagged(cls:type[tag], names:Iterable[str]) -> list[str]:
+    """
+    returns the tagged representation (e.g. "!File File_23") of each name.
+    """
+    prefix = f"{cls.yaml_tag} "
+    return [prefix + str(name) for name in names]
+
+
+class MarkovWriter:
+    """
+    Streams a markov configuration file node by node. The output has the same layout
+    yaml.dump produces for the tagged objects of src.tags, but no document is built
+    in memory and PyYAML's emitter is not involved.
+    """
+    def __init__(self, f:IO[str]):
+        self.__f = f
+        self.__bytes = 0
+        # whether the section or node being written has no entries yet
+        self.__empty = True
+
+    @property
+    def bytes_written(self) -> int:
+        return self.__bytes
+
+    def __write(self, text:str):
+        self.__bytes += len(text)
+        self.__f.write(text)
+
+    def issue_sequence(self, issues:list[str], average_consecutive_commits:list[float]):
+        """
+        writes the issue_sequence section.
+        """
+        self.begin_issue_sequence()
+        self.issue_sequence_entries(issues, average_consecutive_commits)
+        self.end_issue_sequence()
+
+    def begin_issue_sequence(self):
+        """
+        starts an issue_sequence section written in several calls to
+        issue_sequence_entries, closed by end_issue_sequence.
+        """
+        self.__write("issue_sequence:\n  average_consecutive_commits:")
+        self.__empty = True
+
+    def issue_sequence_entries(self, issues:list[str], average_consecutive_commits:list[float]):
+        assert len(issues) == len(average_consecutive_commits)
+        if not len(issues):
+            return
+        if self.__empty:
+            self.__write("\n")
+            self.__empty = False
+        self.__write("".join([
+            f"    {issue}: {format_float(n)}\n" for issue, n in zip(issues, average_consecutive_commits)
+        ]))
+
+    def end_issue_sequence(self):
+        if self.__empty:
+            self.__write(" {}\n")
+
+    def transitions(self):
+        """
+        writes the header of the transitions section, nodes follow.
+        """
+        self.__write("transitions:\n  matrix:\n")
+
+    def node(self, source:str, to:list[str], p:list[float]):
+        """
+        writes the transitions of a single node.
+        """
+        assert len(to) == len(p)
+        if not len(to):
+            self.__write(f"    {source}: []\n")
+            return
+        self.__write(f"    {source}:\n" + "".join([
+            f"    - to: {t}\n      p: {format_float(v)}\n" for t, v in zip(to, p)
+        ]))
+
+    def begin_node(self, source:str):
+        """
+        starts a node whose transitions are written in several calls to
+        node_transitions, closed by end_node. node writes the same output at once.
+        """
+        self.__write(f"    {source}:")
+        self.__empty = True
+
+    def node_transitions(self, to:list[str], p:list[float]):
+        assert len(to) == len(p)
+        if not len(to):
+            return
+        if self.__empty:
+            self.__write("\n")
+            self.__empty = False
+        self.__write("".join([
+            f"    - to: {t}\n      p: {format_float(v)}\n" for t, v in zip(to, p)
+        ]))
+
+    def end_node(self):
+        if self.__empty:
+            self.__write(" []\n")
+
+    def nodes(self, sources:Iterable[str], to:Iterable[list], p:Iterable[list]):
+        for source, node_to, node_p in zip(sources, to, p):
+            self.node(source, node_to, node_p)
+
+    def store(self, store:"TransitionStore", progress:Optional[Progress]=None):
+        """
+        writes the transitions of every source node of a TransitionStore, in order.
+        """
+        labels = store.labels()
+        for source, targets, p in store.rows():
+            self.node(labels[source], labels[targets].tolist(), p.tolist())
+            if progress is not None:
+                progress.update()
+
+
+class BackgroundWriter:
+    """
+    Writes files on a background thread. Text written to the files it opens is
+    gathered in blocks of WRITE_BUFFER characters and queued, at most depth blocks
+    at a time, so callers only wait for the disk when the queue is full. An error
+    of the thread is raised by the next call, or by join, which waits until every
+    file is written and closed.
+    """
+    def __init__(self, depth:int=WRITE_QUEUE):
+        self.__queue = queue.Queue(maxsize=depth)
+        self.__error = None
+        self.__joined = False
+        self.__thread = threading.Thread(target=self.__run, name="background-writer", daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        files = {}
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+            key, text = item
+            # after an error the queue is drained without writing
+            if self.__error is not None:
+                continue
+            try:
+                if isinstance(text, QueuedFile):
+                    files[key] = open(text.path, "w", buffering=WRITE_BUFFER)
+                elif text is not None:
+                    files[key].write(text)
+                else:
+                    files.pop(key).close()
+            except BaseException as e:
+                self.__error = e
+        for f in files.values():
+            f.close()
+
+    def __raise(self):
+        if self.__error is not None:
+            raise self.__error
+
+    def put(self, key:int, text):
+        self.__raise()
+        assert not self.__joined, "the writer was joined."
+        self.__queue.put((key, text))
+
+    def open(self, path:str) -> "QueuedFile":
+        return QueuedFile(self, path)
+
+    def join(self):
+        """
+        waits until every queued block is written and stops the thread.
+        """
+        if not self.__joined:
+            self.__joined = True
+            self.__queue.put(None)
+            self.__thread.join()
+        self.__raise()
+
+
+class QueuedFile:
+    """
+    Text file written by a BackgroundWriter. Closing it does not wait for the
+    writes, see BackgroundWriter.join.
+    """
+    __slots__ = ("writer", "path", "key", "blocks", "size")
+
+    def __init__(self, writer:BackgroundWriter, path:str):
+        self.writer = writer
+        self.path = path
+        self.key = id(self)
+        self.blocks = []
+        self.size = 0
+        writer.put(self.key, self)
+
+    def write(self, text:str) -> int:
+        self.blocks.append(text)
+        self.size += len(text)
+        if self.size >= WRITE_BUFFER:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.blocks:
+            self.writer.put(self.key, "".join(self.blocks))
+            self.blocks, self.size = [], 0
+
+    def close(self):
+        self.flush()
+        self.writer.put(self.key, None)
+
+    def __enter__(self) -> "QueuedFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_markov(path:str, writer:Optional[BackgroundWriter]=None) -> IO[str]:
+    """
+    opens a markov file, written by writer if one is given.
+    """
+    if writer is not None:
+        return writer.open(path)
+    return open(path, "w", buffering=WRITE_BUFFER)
@@ -0,0 +1,35 @@
+import json
+import logging
+import argparse
+from src.model import generate_models
+from src.analysis import markov_statistics, TOP_NODES
+
+PATH_TO_CONFIG = "./configs/config.yaml"
+PATH_TO_REPORT = "./stats.json"
+
+def main(args):
+
+    models = generate_models(args.input, args.split, seed=args.seed, workers=args.workers)
+    statistics = []
+    for model in models:
+        statistics.append(markov_statistics(model, args.top, args.walks, args.seed))
+        logging.info(
+            f"{model.repo_id}: {statistics[-1]['walk_length']:.2f} transitions "
+            f"and {statistics[-1]['files_per_commit']:.2f} file visits per commit"
+        )
+    with open(args.output, "w") as f:
+        json.dump(statistics, f, indent=2)
+    logging.info(f"Statistics saved {args.output}")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Expected statistics of the commits of the generated repo-generator configs.")
+    parser.add_argument("-i", "--input", type=str, help=f"path to input configuration yaml file. Default {PATH_TO_CONFIG}", default=PATH_TO_CONFIG)
+    parser.add_argument("-o", "--output", type=str, help=f"path to the JSON report. Default {PATH_TO_REPORT}", default=PATH_TO_REPORT)
+    parser.add_argument("-s", "--split", type=int, help="number of repos. Default 1", default=1)
+    parser.add_argument("--seed", type=int, help="seed", default=None)
+    parser.add_argument("-w", "--workers", type=int, help="number of worker processes generating repos in parallel. Default 1", default=1)
+    parser.add_argument("--top", type=int, help=f"number of files and issues reported by name. Default {TOP_NODES}", default=TOP_NODES)
+    parser.add_argument("--walks", type=int, help="number of walks simulated to cross-check the expected values, 0 to skip the simulation. Default 0", default=0)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    main(parser.parse_args())
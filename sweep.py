@@ -0,0 +1,41 @@
+import logging
+import argparse
+from src.sweep import expand_variants, parse_override, run_sweep
+from src.artifacts import ARTIFACT_FORMATS
+
+PATH_TO_CONFIG = "./configs/config.yaml"
+PATH_TO_SWEEP = "./sweep"
+SEED = 42
+
+def main(args):
+
+    variants = expand_variants(
+        args.input,
+        args.seeds,
+        args.split,
+        [parse_override(text) for text in args.set]
+    )
+    results = run_sweep(
+        variants,
+        args.output,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        tmp_format=args.tmp_format
+    )
+    failed = [r["name"] for r in results if r["status"] != "ok"]
+    if failed:
+        logging.error(f"{len(failed)} variants failed: {', '.join(failed)}")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Generates the repo-generator configs of a grid of configs, overrides, seeds and splits.")
+    parser.add_argument("-i", "--input", type=str, nargs="+", help=f"paths to input configuration yaml files. Default {PATH_TO_CONFIG}", default=[PATH_TO_CONFIG])
+    parser.add_argument("-o", "--output", type=str, help=f"output directory, each variant is written to its own subdirectory. Default {PATH_TO_SWEEP}", default=PATH_TO_SWEEP)
+    parser.add_argument("-s", "--split", type=int, nargs="+", help="numbers of repos. Default 1", default=[1])
+    parser.add_argument("--seeds", type=int, nargs="+", help=f"seeds. Default {SEED}", default=[SEED])
+    parser.add_argument("--set", type=str, action="append", help="config override with the values to sweep, e.g. --set Issues.number=100,1000. Can be repeated", default=[])
+    parser.add_argument("-w", "--workers", type=int, help="number of variants generated in parallel. Default 1", default=1)
+    parser.add_argument("--cache-dir", type=str, help="directory of the stage cache shared by the variants. Default <output>/.cache", default=None)
+    parser.add_argument("--tmp-format", type=str, choices=ARTIFACT_FORMATS, help="format of the intermediate matrices of each variant. Default none", default="none")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    main(parser.parse_args())